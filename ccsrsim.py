@@ -0,0 +1,126 @@
+#!/usr/bin/python
+
+
+# Local stand-in for the CCSR robot process, for load-testing nlpx off-robot.
+# It serves the nlp fifo interface the same way CCSR does: nlpx writes '*'-terminated messages
+# into the in-fifo, and waits for a newline-terminated acknowledge on the out-fifo.
+# Every message is acknowledged after a programmable latency; 'dump csv' regenerates the CCSR
+# state dump file first, like the real robot. All traffic is logged to a file as
+# <time> TAB <ack latency> TAB <message>.
+#
+# >> python ccsrsim.py -d /tmp/ccsr -l 5 -j 2 -s /tmp/ccsr/ccsrState_dump.csv
+#
+# then create ccsrNlpClass with fifoIn='/tmp/ccsr/nlp_fifo_in', fifoOut='/tmp/ccsr/nlp_fifo_out'
+# and stateDumpFile='/tmp/ccsr/ccsrState_dump.csv'. See nlpsoak.py.
+
+import sys
+import getopt
+import os
+import time
+import random
+
+
+class ccsrSimClass:
+   def __init__(self, fifoDir, stateDumpFile, latency=0.0, jitter=0.0, logFile=None):
+      self.fifoIn = os.path.join(fifoDir, 'nlp_fifo_in')      # nlpx -> CCSR
+      self.fifoOut = os.path.join(fifoDir, 'nlp_fifo_out')    # CCSR -> nlpx
+      self.stateDumpFile = stateDumpFile
+      self.latency = latency      # seconds before a message is acknowledged
+      self.jitter = jitter        # random extra latency, uniform in [0, jitter] seconds
+      self.log = None
+      if logFile != None:
+         self.log = open(logFile, 'a')
+      self.messages = 0
+      for fifo in (self.fifoIn, self.fifoOut):
+         if not os.path.exists(fifo):
+            os.mkfifo(fifo)
+
+   # Write a CCSR state dump with random but plausible values, in the format of the real robot
+   def dumpState(self):
+      f = open(self.stateDumpFile + '.tmp', 'w')
+      f.write('happiness,%d,\n' % random.randint(-255, 255))
+      f.write('arousal,%d,\n' % random.randint(0, 255))
+      f.write('light,%d,\n' % random.randint(0, 1023))
+      f.write('temperature,%d,degrees\n' % random.randint(15, 35))
+      f.write('compass,%d,degrees\n' % random.randint(0, 359))
+      f.write('battery,%d,percent\n' % random.randint(0, 100))
+      f.write('power,%d,milliwatt\n' % random.randint(1000, 4000))
+      f.close()
+      os.rename(self.stateDumpFile + '.tmp', self.stateDumpFile)
+
+   def handle(self, message):
+      start = time.time()
+      delay = self.latency + random.uniform(0, self.jitter)
+      if delay > 0:
+         time.sleep(delay)
+      if message == 'dump csv':
+         self.dumpState()
+      self.messages = self.messages + 1
+      if self.log != None:
+         self.log.write('%f\t%f\t%s\n' % (start, time.time() - start, message))
+         self.log.flush()
+
+   # Serve one nlpx client until it closes the fifo
+   def serveClient(self):
+      # Same open order as nlpx (in-fifo first), otherwise both sides block
+      rfd = os.open(self.fifoIn, os.O_RDONLY)
+      wfd = os.open(self.fifoOut, os.O_WRONLY)
+      data = ''
+      try:
+         while True:
+            chunk = os.read(rfd, 4096)
+            if chunk == '':
+               break                  # nlpx closed the fifo
+            data = data + chunk
+            while '*' in data:
+               message, data = data.split('*', 1)
+               self.handle(message)
+               os.write(wfd, 'ok\n')
+      finally:
+         os.close(rfd)
+         os.close(wfd)
+
+   def serve(self, once=False):
+      while True:
+         self.serveClient()
+         if once:
+            break
+
+
+if __name__ == '__main__':
+   fifoDir = '/tmp/ccsr'
+   stateDumpFile = None
+   latency = 0.0
+   jitter = 0.0
+   logFile = None
+   once = False
+
+   try:
+      opts, args = getopt.getopt(sys.argv[1:], "hd:s:l:j:o:1", ["help", "fifo-dir=", "state-dump=", "latency=", "jitter=", "log=", "once"])
+   except getopt.GetoptError:
+      print 'ccsrsim.py -d <fifo dir> -s <state dump file> -l <latency ms> -j <jitter ms> -o <traffic log> -1'
+      sys.exit(2)
+   for opt, arg in opts:
+      if opt in ("-h", "--help"):
+         print 'ccsrsim.py -d <fifo dir> -s <state dump file> -l <latency ms> -j <jitter ms> -o <traffic log> -1'
+         sys.exit()
+      elif opt in ("-d", "--fifo-dir"):
+         fifoDir = arg
+      elif opt in ("-s", "--state-dump"):
+         stateDumpFile = arg
+      elif opt in ("-l", "--latency"):
+         latency = float(arg) / 1000
+      elif opt in ("-j", "--jitter"):
+         jitter = float(arg) / 1000
+      elif opt in ("-o", "--log"):
+         logFile = arg
+      elif opt in ("-1", "--once"):
+         once = True
+   if not os.path.isdir(fifoDir):
+      os.makedirs(fifoDir)
+   if stateDumpFile == None:
+      stateDumpFile = os.path.join(fifoDir, 'ccsrState_dump.csv')
+
+   sim = ccsrSimClass(fifoDir, stateDumpFile, latency, jitter, logFile)
+   sim.dumpState()
+   sim.serve(once)
@@ -0,0 +1,80 @@
+#!/usr/bin/python
+
+# nlpx batch parsing. Parsing (pattern.en tagging, chunking and relation finding) and sentence
+# classification don't depend on CCSR memory, so for large transcript archives they can run in
+# a pool of worker processes. The workers return the tagged text and sentence types; the
+# response generation, which reads and updates memory, stays in the calling process and runs
+# in input order (see ccsrNlpClass.nlpParseMany).
+
+import time
+import itertools
+import multiprocessing
+
+from nlp_lazy import lazyModuleClass
+from nlp_sa  import sentenceAnalysisClass
+
+en = lazyModuleClass('pattern.en')
+
+
+# Pool initializer: load the models once per worker, not on its first line
+def initWorker():
+   en.parsetree('hello', relations=True, lemmata=True)
+
+# Parse and classify one line in a worker process. Returns (tagged string, tags, classification, timings),
+# where classification is a list of (sentence type, concept, property) per sentence, or
+# (None, None, error message, timings) if the line could not be parsed. timings is a list of
+# (stage, seconds) with the same stage names as nlpParse uses ('parsetree', 'sentenceType'), so the
+# caller can add them to its metrics
+def parseWorker(line):
+   timings = []
+   try:
+      start = time.time()
+      tagged = en.parse(line.strip(), relations=True, lemmata=True)
+      text = en.Text(tagged)
+      timings.append(('parsetree', time.time() - start))
+      classification = []
+      for sentence in text:
+         sa = sentenceAnalysisClass(sentence)
+         start = time.time()
+         st = sa.sentenceType()
+         timings.append(('sentenceType', time.time() - start))
+         classification.append((st, sa.concept, sa.property))
+      return (unicode(tagged), list(tagged.tags), classification, timings)
+   except Exception, e:
+      return (None, None, '%s: %s' % (e.__class__.__name__, e), timings)
+
+# Rebuild the pattern.en Text from a worker result. This only splits the tagged string,
+# it doesn't run the tagger again
+def rebuildText(tagged, tags):
+   return en.Text(tagged, token=tags)
+
+
+class batchParserClass:
+   def __init__(self, processes=None, chunksize=16):
+      self.processes = processes      # None: one worker per core
+      self.chunksize = chunksize      # lines handed to a worker at a time
+      self.pool = None
+
+   # Yield (line, worker result) for 'lines', in input order, while later lines are still being parsed.
+   # Lines are read a window at a time, and the next window is parsed while the results of the
+   # current one are consumed, so memory use doesn't grow with the size of the transcript
+   def parse(self, lines):
+      if self.pool == None:
+         self.pool = multiprocessing.Pool(self.processes, initWorker)
+      lines = iter(lines)
+      window = self.chunksize * 4 * (self.processes or multiprocessing.cpu_count())
+      block = list(itertools.islice(lines, window))
+      results = self.pool.imap(parseWorker, block, self.chunksize)
+      while len(block) > 0:
+         nextBlock = list(itertools.islice(lines, window))
+         nextResults = self.pool.imap(parseWorker, nextBlock, self.chunksize)
+         for pair in itertools.izip(block, results):
+            yield pair
+         block = nextBlock
+         results = nextResults
+
+   def close(self):
+      if self.pool != None:
+         self.pool.close()
+         self.pool.join()
+         self.pool = None
@@ -8,13 +8,6 @@ import sys
 import re
 import time
 
-from pattern.en import parse
-from pattern.en import pprint
-from pattern.en import parsetree
-from pattern.en import wordnet
-from pattern.en import pluralize, singularize
-from pattern.en import conjugate, lemma, lexeme
-
 
 class capabilitiesClass:
    def __init__(self):
@@ -0,0 +1,131 @@
+#!/usr/bin/python
+
+# nlpx hedged brain. Answers an utterance with whichever brain gives a confident answer first:
+# the local nlpxCCSR brain (ccsrNlpClass.nlpParseStream) starts right away, the remote ANNA brain
+# (roboticsWebClass.brainAPI) is asked in parallel, or after 'delay' seconds. The local answer is
+# confident if every sentence was recognized and answered (not 'Sorry, I don't know ...'), the
+# remote one if it is not empty. If the local brain isn't confident the remote brain is asked
+# immediately. If neither brain answers within 'timeout' seconds, nlpx apologizes and listens again.
+# The loser is cancelled: the local brain stops between messages, a remote answer still in flight
+# is ignored. Win/loss counts and answer latency are kept per brain, see statsReport.
+#
+#    hedge = hedgedBrainClass(nlp, delay=0.3)
+#    hedge.ask('what is the tallest building in the world')
+
+import time
+import threading
+import Queue
+
+from nlp_metrics import histogramClass
+from nlpx import ccsrStatusRequest
+
+
+class hedgedBrainClass:
+   def __init__(self, nlp, delay=0.0, timeout=10.0):
+      self.nlp = nlp            # ccsrNlpClass instance
+      self.delay = delay        # seconds before the remote brain is asked
+      self.timeout = timeout    # seconds to wait for any answer
+      # The local brain updates nlp memory, so a cancelled local run must finish before the next starts
+      self.localLock = threading.Lock()
+      self.stats = {}
+      for brain in ('local', 'remote'):
+         self.stats[brain] = {'wins': 0, 'losses': 0, 'latency': histogramClass()}
+
+   # Answer 'line', sending the winning brain's response to the nlp sinks. Returns the winner,
+   # 'local' or 'remote', or None if neither brain answered in time
+   def ask(self, line):
+      answers = Queue.Queue()
+      cancel = threading.Event()
+      askRemote = threading.Event()
+      start = time.time()
+      local = threading.Thread(target=self.localBrain, args=(line, answers, cancel, start))
+      remote = threading.Thread(target=self.remoteBrain, args=(line, answers, cancel, askRemote, start))
+      for t in (local, remote):
+         t.daemon = True
+         t.start()
+
+      results = {}
+      winner = None
+      deadline = start + self.timeout
+      while len(results) < 2 and time.time() < deadline:
+         try:
+            brain, messages, confident, latency = answers.get(timeout=max(0, deadline - time.time()))
+         except Queue.Empty:
+            break
+         results[brain] = messages
+         self.stats[brain]['latency'].add(latency)
+         self.nlp.metrics.observe('hedge.' + brain, latency)
+         if confident:
+            winner = brain
+            break
+         # Local brain doesn't know, don't wait for the hedge delay
+         askRemote.set()
+      cancel.set()
+      askRemote.set()
+
+      if winner == None:
+         # Nobody was confident: prefer whatever the local brain came up with
+         for brain in ('local', 'remote'):
+            if brain in results:
+               winner = brain
+               break
+      for brain in self.stats:
+         if brain == winner:
+            self.stats[brain]['wins'] += 1
+            self.nlp.metrics.count('hedge.' + brain + '.wins')
+         else:
+            self.stats[brain]['losses'] += 1
+            self.nlp.metrics.count('hedge.' + brain + '.losses')
+      if winner != None:
+         for m in results[winner]:
+            self.nlp.response(m)
+      else:
+         # Don't leave CCSR waiting for a listen command
+         self.nlp.metrics.count('hedge.timeouts')
+         self.nlp.response(self.nlp.render('noAnswer'))
+         self.nlp.response(('listen', ''))
+      return winner
+
+   def localBrain(self, line, answers, cancel, start):
+      self.localLock.acquire()
+      try:
+         messages = []
+         confident = False
+         try:
+            stream = self.nlp.nlpParseStream(line)
+            for m in stream:
+               if cancel.is_set():
+                  stream.close()
+                  return
+               if m == ccsrStatusRequest:
+                  # Not part of the answer: CCSR must dump its state before the local brain continues
+                  self.nlp.response(m)
+               else:
+                  messages.append(m)
+            types = [st for sa, st in self.nlp.lastAnalysis]
+            confident = len(types) > 0 and None not in types and self.nlp.lastAnswered
+         except Exception:
+            self.nlp.metrics.count('hedge.local.errors')
+         answers.put(('local', messages, confident, time.time() - start))
+      finally:
+         self.localLock.release()
+
+   def remoteBrain(self, line, answers, cancel, askRemote, start):
+      askRemote.wait(self.delay)
+      if cancel.is_set():
+         return
+      messages = []
+      try:
+         messages = self.nlp.remoteBrainAnswer(line)
+      except Exception:
+         self.nlp.metrics.count('hedge.remote.errors')
+      answers.put(('remote', messages, len(messages) > 0, time.time() - start))
+
+   # Return a printable report of wins, losses and answer latency per brain
+   def statsReport(self):
+      report = []
+      for brain in ('local', 'remote'):
+         s = self.stats[brain]
+         h = s['latency'].summary()
+         report.append('%s: %d wins, %d losses, latency p50<=%.0fms p90<=%.0fms' % (brain, s['wins'], s['losses'], h['p50'] * 1000, h['p90'] * 1000))
+      return ', '.join(report)
@@ -0,0 +1,44 @@
+#!/usr/bin/python
+
+# nlpx lazy loader. Importing pattern.en and loading its lexicon, tagger and
+# WordNet corpus takes several seconds on the CCSR board, and the robotics_web
+# module is only needed when the remote ANNA brain is used. lazyModuleClass
+# stands in for a module and only imports it on first attribute access, e.g.:
+#
+#    en = lazyModuleClass('pattern.en')
+#    en.parsetree('how are you')       # pattern.en is imported here
+
+import sys
+import time
+import threading
+
+
+class lazyModuleClass:
+   def __init__(self, name):
+      self.name = name            # full module name, e.g. 'pattern.en'
+      self.module = None          # the real module, once imported
+      self.loadTime = 0.0         # seconds spent importing the module
+      self.lock = threading.Lock()
+
+   # Import the module (once) and return it. Safe to call from several threads,
+   # e.g. the warm-up thread and the first nlpParse call
+   def load(self):
+      if self.module == None:
+         self.lock.acquire()
+         try:
+            if self.module == None:
+               start = time.time()
+               __import__(self.name)
+               self.loadTime = time.time() - start
+               self.module = sys.modules[self.name]
+         finally:
+            self.lock.release()
+      return self.module
+
+   # Return True if the module has been imported already
+   def loaded(self):
+      return self.module != None
+
+   # Only called for attributes not found on the instance itself: forward to the real module
+   def __getattr__(self, attr):
+      return getattr(self.load(), attr)
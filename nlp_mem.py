@@ -12,12 +12,6 @@
 import sys
 import re
 
-from pattern.en import parse
-from pattern.en import pprint
-from pattern.en import parsetree
-from pattern.en import wordnet
-from pattern.en import pluralize, singularize
-from pattern.en import conjugate, lemma, lexeme
 
 # Information about a single concept
 class conceptClass:
@@ -32,8 +26,9 @@ class conceptClass:
 # CCSR memory class. Collection of concepts      
 class memoryClass():
 
-   def __init__(self):
+   def __init__(self, metrics=None):
       self.concepts = {}
+      self.metrics = metrics      # optional metricsClass, times concept lookups
       self.person = {'I': '1sg',
                      'you': '2sg'
                      }
@@ -52,7 +47,10 @@ class memoryClass():
 
    # Return True if concept 'c' (string) is in memory
    def known(self, c):
-      return (c in self.concepts)
+      if self.metrics == None:
+         return (c in self.concepts)
+      with self.metrics.timer('memory'):
+         return (c in self.concepts)
 
 
 
@@ -0,0 +1,239 @@
+#!/usr/bin/python
+
+# nlpx metrics class. Collects counters and latency histograms for the stages of the NLP
+# pipeline (parsetree, sentenceType, memory lookups, updateCCSRStatus, wolframAlphaAPI, fifo
+# round trips) and per sentence type, e.g. 'sentence.questionState'.
+# When disabled, every call returns right away, so the instrumentation can stay in place.
+# Independently of that, a trace of the stage timings of a single call can be collected with
+# beginTrace/endTrace (used by the slow-utterance recorder).
+#
+#    metrics = metricsClass(True)
+#    start = metrics.start()
+#    ...
+#    metrics.stop('parsetree', start)
+#    metrics.count('wolframAlphaAPI.calls')
+#    metrics.query('parsetree')      => {'count': 12, 'mean': 0.021, 'p50': 0.02, ...}
+#
+# The metrics can be written periodically to a JSON and CSV file, see startExport.
+
+import os
+import time
+import json
+import bisect
+import threading
+
+
+# Latency histogram with fixed, roughly logarithmic bucket bounds (seconds). Percentiles are
+# reported as the upper bound of the bucket they fall in
+class histogramClass:
+   bounds = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0)
+
+   def __init__(self):
+      self.buckets = [0] * (len(self.bounds) + 1)   # last bucket: slower than 10s
+      self.count = 0
+      self.total = 0.0
+      self.max = 0.0
+
+   def add(self, t):
+      self.buckets[bisect.bisect_left(self.bounds, t)] += 1
+      self.count = self.count + 1
+      self.total = self.total + t
+      if t > self.max:
+         self.max = t
+
+   def percentile(self, p):
+      if self.count == 0:
+         return 0.0
+      rank = p / 100.0 * self.count
+      seen = 0
+      for i in range(len(self.buckets)):
+         seen = seen + self.buckets[i]
+         if seen >= rank and self.buckets[i] > 0:
+            if i < len(self.bounds):
+               return min(self.bounds[i], self.max)
+            return self.max
+      return self.max
+
+   def summary(self):
+      if self.count == 0:
+         mean = 0.0
+      else:
+         mean = self.total / self.count
+      return {'count': self.count,
+              'mean': mean,
+              'p50': self.percentile(50),
+              'p90': self.percentile(90),
+              'p99': self.percentile(99),
+              'max': self.max}
+
+
+# Context manager timing a block of code: with metrics.timer('parsetree'): ...
+class timerClass:
+   def __init__(self, metrics, name):
+      self.metrics = metrics
+      self.name = name
+
+   def __enter__(self):
+      self.startTime = time.time()
+      return self
+
+   def __exit__(self, type, value, traceback):
+      self.metrics.stop(self.name, self.startTime)
+      if type != None:
+         self.metrics.count(self.name + '.errors')
+      return False
+
+# Returned by metricsClass.timer when metrics are disabled
+class nullTimerClass:
+   def __enter__(self):
+      return self
+
+   def __exit__(self, type, value, traceback):
+      return False
+
+nullTimer = nullTimerClass()
+
+
+class metricsClass:
+   def __init__(self, enabled=False):
+      self.enabled = enabled
+      self.counters = {}          # name -> int
+      self.histograms = {}        # name -> histogramClass
+      self.lock = threading.Lock()
+      self.startTime = time.time()
+      self.exportThread = None
+      self.exportStop = threading.Event()
+      self.tracing = False        # if True, observe() also appends (name, seconds) to self.trace
+      self.trace = []
+
+   # Increment counter 'name' by n
+   def count(self, name, n=1):
+      if not self.enabled:
+         return
+      self.lock.acquire()
+      try:
+         self.counters[name] = self.counters.get(name, 0) + n
+      finally:
+         self.lock.release()
+
+   # Add a latency sample of t seconds to histogram 'name'
+   def observe(self, name, t):
+      if self.tracing:
+         self.trace.append((name, t))
+      if not self.enabled:
+         return
+      self.lock.acquire()
+      try:
+         if name not in self.histograms:
+            self.histograms[name] = histogramClass()
+         self.histograms[name].add(t)
+      finally:
+         self.lock.release()
+
+   # start/stop pair for timing code without a with-block. start returns None when disabled
+   def start(self):
+      if not (self.enabled or self.tracing):
+         return None
+      return time.time()
+
+   def stop(self, name, start):
+      if start != None:
+         self.observe(name, time.time() - start)
+
+   def timer(self, name):
+      if not (self.enabled or self.tracing):
+         return nullTimer
+      return timerClass(self, name)
+
+   # Start collecting the stage timings of one call
+   def beginTrace(self):
+      self.trace = []
+      self.tracing = True
+
+   # Stop tracing, return list of (stage name, seconds) in the order the stages finished
+   def endTrace(self):
+      self.tracing = False
+      trace = self.trace
+      self.trace = []
+      return trace
+
+   # Query API. Return counter value or histogram summary for 'name', None if never recorded
+   def query(self, name):
+      self.lock.acquire()
+      try:
+         if name in self.histograms:
+            return self.histograms[name].summary()
+         return self.counters.get(name)
+      finally:
+         self.lock.release()
+
+   # Return counter 'name' as a fraction of counter 'total', e.g. rate('sentences.unknown', 'sentences')
+   def rate(self, name, total):
+      self.lock.acquire()
+      try:
+         if self.counters.get(total, 0) == 0:
+            return 0.0
+         return float(self.counters.get(name, 0)) / self.counters[total]
+      finally:
+         self.lock.release()
+
+   # Return all metrics as a dict, suitable for json
+   def snapshot(self):
+      self.lock.acquire()
+      try:
+         histograms = {}
+         for name in self.histograms:
+            histograms[name] = self.histograms[name].summary()
+         return {'time': time.time(),
+                 'uptime': time.time() - self.startTime,
+                 'counters': dict(self.counters),
+                 'histograms': histograms}
+      finally:
+         self.lock.release()
+
+   def reset(self):
+      self.lock.acquire()
+      try:
+         self.counters = {}
+         self.histograms = {}
+         self.startTime = time.time()
+      finally:
+         self.lock.release()
+
+   # Write snapshot to <fileName>.json and <fileName>.csv. Files are replaced atomically, so
+   # readers never see a partial file
+   def export(self, fileName):
+      snapshot = self.snapshot()
+      f = open(fileName + '.json.tmp', 'w')
+      json.dump(snapshot, f, indent=1, sort_keys=True)
+      f.close()
+      os.rename(fileName + '.json.tmp', fileName + '.json')
+      f = open(fileName + '.csv.tmp', 'w')
+      f.write('kind,name,count,mean,p50,p90,p99,max\n')
+      for name in sorted(snapshot['counters']):
+         f.write('counter,%s,%d,,,,,\n' % (name, snapshot['counters'][name]))
+      for name in sorted(snapshot['histograms']):
+         h = snapshot['histograms'][name]
+         f.write('histogram,%s,%d,%f,%f,%f,%f,%f\n' % (name, h['count'], h['mean'], h['p50'], h['p90'], h['p99'], h['max']))
+      f.close()
+      os.rename(fileName + '.csv.tmp', fileName + '.csv')
+
+   # Export metrics every 'interval' seconds from a background thread
+   def startExport(self, fileName, interval=60):
+      if self.exportThread != None:
+         return
+      self.exportThread = threading.Thread(target=self.exportLoop, args=(fileName, interval), name='nlpx-metrics')
+      self.exportThread.daemon = True
+      self.exportThread.start()
+
+   def stopExport(self):
+      if self.exportThread != None:
+         self.exportStop.set()
+         self.exportThread.join()
+         self.exportThread = None
+         self.exportStop.clear()
+
+   def exportLoop(self, fileName, interval):
+      while not self.exportStop.wait(interval):
+         self.export(fileName)
+      self.export(fileName)
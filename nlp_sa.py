@@ -6,13 +6,6 @@
 import sys
 import re
 
-from pattern.en import parse
-from pattern.en import pprint
-from pattern.en import parsetree
-from pattern.en import wordnet
-from pattern.en import pluralize, singularize
-from pattern.en import conjugate, lemma, lexeme
-
 
 # Sentence Salysis Class. This is instantiated with a pattern.en sentence class
 class sentenceAnalysisClass:
@@ -233,5 +226,6 @@ class sentenceAnalysisClass:
        #   - concept phrase has more than 2 words (excluding a determiner)
        # e.g. 'where is the cat' => simple
        # e.g. 'where is the largest cat in the world' => complex
-       print self.concept
+       if self.debug:
+          print self.concept
        return (len(self.getSentenceChunk(self.concept).words) > 2) or (self.getSentenceChunk(self.concept).words[0].type != 'DT')
@@ -0,0 +1,85 @@
+#!/usr/bin/python
+
+# nlpx response sinks. ccsrNlpClass.nlpParseStream yields response messages as (command, argument)
+# tuples, e.g. ('say', 'Hi, how are you.'), ('facial', '14') or ('listen', ''). A sink delivers
+# these messages somewhere: the CCSR fifo, stdout, an in-memory buffer or a socket.
+# ccsrNlpClass.response sends every message to each sink in ccsrNlpClass.sinks.
+#
+# A sink is any object with a send(message) method.
+
+import sys
+
+
+# Convert a CCSR command string to a message tuple: 'say I am great' => ('say', 'I am great')
+def toMessage(s):
+   if isinstance(s, tuple):
+      return s
+   parts = s.split(' ', 1)
+   if len(parts) == 1:
+      return (parts[0], '')
+   return (parts[0], parts[1])
+
+# Convert a message tuple back to the CCSR command string: ('say', 'I am great') => 'say I am great'
+def formatMessage(m):
+   if not isinstance(m, tuple):
+      return m
+   if m[1] == '':
+      return m[0]
+   return '%s %s' % m
+
+
+# Print messages, as nlpx always did in debug mode
+class stdoutSinkClass:
+   def __init__(self, stream=None):
+      self.stream = stream        # None: whatever sys.stdout is at the time of sending
+
+   def send(self, m):
+      stream = self.stream
+      if stream == None:
+         stream = sys.stdout
+      stream.write(formatMessage(m) + '\n')
+
+
+# CCSR nlp fifo: send '*'-terminated message, then block until CCSR acknowledges with a line.
+# The last acknowledge is kept in self.ack
+class fifoSinkClass:
+   def __init__(self, wfifo, rfifo, metrics=None):
+      self.wfifo = wfifo
+      self.rfifo = rfifo
+      self.metrics = metrics      # optional metricsClass, times fifo round trips
+      self.ack = ''
+
+   def send(self, m):
+      start = None
+      if self.metrics != None:
+         start = self.metrics.start()
+      self.wfifo.write(formatMessage(m) + '*')
+      self.wfifo.flush()
+      # This should block untill cmd response is received. Used to sync.
+      self.ack = self.rfifo.readline()
+      if start != None:
+         self.metrics.stop('fifo', start)
+
+
+# Collect messages in memory
+class bufferSinkClass:
+   def __init__(self):
+      self.messages = []
+
+   def send(self, m):
+      self.messages.append(toMessage(m))
+
+   # Return collected messages and empty the buffer
+   def drain(self):
+      messages = self.messages
+      self.messages = []
+      return messages
+
+
+# Send messages as newline-terminated lines over a connected socket
+class socketSinkClass:
+   def __init__(self, sock):
+      self.sock = sock
+
+   def send(self, m):
+      self.sock.sendall(formatMessage(m) + '\n')
@@ -0,0 +1,159 @@
+#!/usr/bin/python
+
+# nlpx slow-utterance recorder. Wraps ccsrNlpClass.nlpParse: every call is run with a cheap
+# stage-timing trace (see metricsClass.beginTrace) and a statistical profile (stackSamplerClass),
+# and 1 in 'profileRate' calls also under cProfile. If the call takes longer than 'threshold'
+# seconds, the input text, the sentence analysis (chunk string, type, concept), the stage timings,
+# the sampled profile and, for cProfiled calls, the cProfile dump are saved in their own directory:
+#
+#    <directory>/20261019-142501-000003/utterance.json
+#    <directory>/20261019-142501-000003/samples.json
+#    <directory>/20261019-142501-000003/profile.prof
+#
+# cProfile is expensive on the pure-Python pattern.en tagger: it roughly doubles the time of a
+# call-heavy parse, so it is off by default (profileRate=0). The sampler looks at the stack every
+# 'interval' seconds of CPU time instead of at every function call, so it can stay on. It uses
+# SIGPROF, so it only runs when nlpParse is called from the main thread.
+# Only the newest 'maxRecords' recordings are kept. Use nlpslow.py to summarize them.
+
+import os
+import time
+import json
+import shutil
+import signal
+import threading
+import cProfile
+
+
+# Statistical profiler: counts the functions on the main thread's stack every 'interval' seconds
+# of CPU time. 'self' counts samples in the function itself, 'cumulative' samples with the
+# function anywhere on the stack
+class stackSamplerClass:
+   def __init__(self, interval=0.005):
+      self.interval = interval
+      self.samples = 0
+      self.counts = {}              # (file, line, function) -> [self, cumulative]
+      self.previous = None
+
+   # True if the sampler can run here: SIGPROF is only delivered to the main thread
+   def available(self):
+      return hasattr(signal, 'setitimer') and isinstance(threading.current_thread(), threading._MainThread)
+
+   def start(self):
+      self.samples = 0
+      self.counts = {}
+      self.previous = signal.signal(signal.SIGPROF, self.sample)
+      signal.siginterrupt(signal.SIGPROF, False)     # restart system calls, e.g. fifo reads
+      signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+   def stop(self):
+      signal.setitimer(signal.ITIMER_PROF, 0, 0)
+      signal.signal(signal.SIGPROF, self.previous)
+
+   def sample(self, signum, frame):
+      self.samples = self.samples + 1
+      seen = set()
+      first = True
+      while frame != None:
+         code = frame.f_code
+         key = (code.co_filename, code.co_firstlineno, code.co_name)
+         if key not in self.counts:
+            self.counts[key] = [0, 0]
+         if first:
+            self.counts[key][0] = self.counts[key][0] + 1
+            first = False
+         if key not in seen:
+            seen.add(key)
+            self.counts[key][1] = self.counts[key][1] + 1
+         frame = frame.f_back
+
+   # Return the profile as a dict, functions sorted by cumulative samples
+   def stats(self, limit=50):
+      functions = []
+      for (fileName, line, name), (selfCount, cumulative) in self.counts.items():
+         functions.append({'function': '%s:%d(%s)' % (fileName, line, name), 'self': selfCount, 'cumulative': cumulative})
+      functions.sort(key=lambda f: (f['cumulative'], f['self']), reverse=True)
+      return {'interval': self.interval, 'samples': self.samples, 'functions': functions[:limit]}
+
+
+class slowRecorderClass:
+   def __init__(self, nlp, threshold=1.0, directory='slow_utterances', maxRecords=50, profileRate=0):
+      self.nlp = nlp                # ccsrNlpClass instance
+      self.threshold = threshold    # seconds
+      self.profileRate = profileRate   # profile 1 in profileRate calls, 0: never
+      self.calls = 0
+      self.directory = directory
+      self.maxRecords = maxRecords
+      self.recorded = 0             # number of slow utterances recorded by this instance
+      self.sampler = stackSamplerClass()
+      if not os.path.isdir(self.directory):
+         os.makedirs(self.directory)
+
+   # Same interface as ccsrNlpClass.nlpParse
+   def nlpParse(self, line):
+      profiler = None
+      if self.profileRate > 0 and self.calls % self.profileRate == 0:
+         profiler = cProfile.Profile()
+      self.calls = self.calls + 1
+      sampler = None
+      if self.sampler.available():
+         sampler = self.sampler
+      self.nlp.metrics.beginTrace()
+      start = time.time()
+      if sampler != None:
+         sampler.start()
+      if profiler != None:
+         profiler.enable()
+      try:
+         self.nlp.nlpParse(line)
+      finally:
+         if profiler != None:
+            profiler.disable()
+         if sampler != None:
+            sampler.stop()
+         latency = time.time() - start
+         stages = self.nlp.metrics.endTrace()
+         if latency > self.threshold:
+            self.record(line, latency, stages, profiler, sampler)
+
+   def record(self, line, latency, stages, profiler, sampler=None):
+      name = time.strftime('%Y%m%d-%H%M%S') + '-%06d' % self.recorded
+      self.recorded = self.recorded + 1
+      path = os.path.join(self.directory, name)
+      os.makedirs(path)
+      analysis = []
+      for sa, st in self.nlp.lastAnalysis:
+         analysis.append({'sentence': sa.s.string,
+                          'chunks': sa.chunkToString(),
+                          'type': st,
+                          'concept': sa.getSentenceRole(sa.concept)})
+      f = open(os.path.join(path, 'utterance.json'), 'w')
+      json.dump({'time': time.time(),
+                 'text': line.strip(),
+                 'latency': latency,
+                 'analysis': analysis,
+                 'stages': stages,
+                 'profiled': profiler != None}, f, indent=1)
+      f.close()
+      if sampler != None:
+         f = open(os.path.join(path, 'samples.json'), 'w')
+         json.dump(sampler.stats(), f, indent=1)
+         f.close()
+      if profiler != None:
+         profiler.dump_stats(os.path.join(path, 'profile.prof'))
+      self.rotate()
+
+   # Delete the oldest recordings, keeping at most maxRecords. Directory names sort by time
+   def rotate(self):
+      records = self.records(self.directory)
+      for name in records[:max(0, len(records) - self.maxRecords)]:
+         shutil.rmtree(os.path.join(self.directory, name))
+
+   # Return sorted list of recording directory names in 'directory'
+   @staticmethod
+   def records(directory):
+      names = []
+      for name in os.listdir(directory):
+         if os.path.isfile(os.path.join(directory, name, 'utterance.json')):
+            names.append(name)
+      return sorted(names)
@@ -0,0 +1,170 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# nlpx speech text normalization and response rendering.
+#
+# normalizeSpeech turns free text (WolframAlpha plaintext pods, WordNet glosses, phrases from
+# memory) into text espeak can read: units, symbols and abbreviations are spelled out, other
+# characters dropped, and ';' separated clauses become sentences. The rules are data (the tables
+# below), compiled into a single regular expression that is applied in one pass:
+#    '-5 °C; wind 10 mph' => ['minus 5 degrees Celsius. Wind 10 miles per hour']
+#
+# responseRendererClass renders the verbal responses of nlpx from templates, with memoized verb
+# conjugations. Free text filled into a template is normalized:
+#    renderer.render('state', phrase='the cat', person='3sg', state='yellow') => ('say', 'the cat is yellow')
+
+import re
+
+
+# Units, only replaced after a number: '10 mph', '72°F'
+units = {u'°F':   'degrees Fahrenheit',
+         u'°C':   'degrees Celsius',
+         u'° F':  'degrees Fahrenheit',
+         u'° C':  'degrees Celsius',
+         'mph':   'miles per hour',
+         'km/h':  'kilometers per hour',
+         'km':    'kilometers',
+         'cm':    'centimeters',
+         'mm':    'millimeters',
+         'mi':    'miles',
+         'ft':    'feet',
+         'kg':    'kilograms',
+         'lb':    'pounds',
+         'mW':    'milliwatt',
+         'kW':    'kilowatt',
+         'W':     'watt',
+         'V':     'volt'}
+
+# Symbols, anywhere in the text. They are spoken as separate words
+symbols = {'%':       'percent',
+           '&':       'and',
+           '+':       'plus',
+           '=':       'equals',
+           '~':       'about',
+           '$':       'dollar',
+           u'°':      'degrees',
+           u'×':      'times',
+           u'±':      'plus or minus',
+           u'€':      'euro',
+           u'£':      'pound'}
+
+# Abbreviations, as whole words. Street names ('St.', 'Dr.') are ambiguous and left alone
+abbreviations = {'approx.': 'approximately',
+                 'e.g.':    'for example',
+                 'i.e.':    'that is',
+                 'etc.':    'et cetera',
+                 'vs.':     'versus',
+                 'Mr.':     'Mister',
+                 'Mrs.':    'Missus'}
+
+# Part of speech annotations in WolframAlpha definitions ('noun a machine that ...'), removed by
+# stripAnnotations. Only for WolframAlpha plaintext: elsewhere these are ordinary words
+annotations = ('noun', 'verb', 'adjective', 'adverb')
+
+# Signs before a number are spoken: '-5' => 'minus 5'. Between numbers a dash is a range:
+# '1990-2000' => '1990 to 2000'. Other dashes separate words
+minusSigns = u'-\u2212'
+
+# Characters that are passed to espeak unchanged
+speechCharacters = "A-Za-z0-9 .'\n"
+
+
+# Return an alternation matching any of the keys, longest first so 'km/h' wins over 'km'
+def alternation(keys):
+   return '|'.join([re.escape(k) for k in sorted(keys, key=len, reverse=True)])
+
+speechPattern = re.compile(u'(?P<abbreviation>(?<![A-Za-z])(?:' + alternation(abbreviations) + u'))'
+                           u'|(?P<unit>(?<=[0-9]) ?(?:' + alternation(units) + u')(?![A-Za-z]))'
+                           u'|(?P<symbol> ?(?:' + alternation(symbols) + u') ?)'
+                           u'|(?P<range>(?<=[0-9])[' + minusSigns + u'](?=[0-9]))'
+                           u'|(?P<minus>(?<![A-Za-z0-9])[' + minusSigns + u'](?=[0-9]))'
+                           u'|(?P<dash>[' + minusSigns + u'])'
+                           u'|(?P<clause>; *[a-z]?)'
+                           u'|(?P<drop>[^' + speechCharacters + u'])', re.UNICODE)
+
+def speechReplacement(m):
+   kind = m.lastgroup
+   s = m.group(kind)
+   if kind == 'abbreviation':
+      return abbreviations[s]
+   elif kind == 'unit':
+      return ' ' + units[s.lstrip(' ')]
+   elif kind == 'symbol':
+      # One space on either side, unless at the end of a word: '50%.' => '50 percent.'
+      if s.endswith(' ') or m.string[m.end():m.end() + 1].isalnum():
+         return ' ' + symbols[s.strip(' ')] + ' '
+      return ' ' + symbols[s.strip(' ')]
+   elif kind == 'range':
+      return ' to '
+   elif kind == 'minus':
+      return 'minus '
+   elif kind == 'dash':
+      return ' '
+   elif kind == 'clause':
+      # '; next clause' => '. Next clause'
+      return '. ' + s.lstrip('; ').upper()
+   return ''
+
+annotationPattern = re.compile(u'(?<![A-Za-z])(?:' + alternation(annotations) + u') ')
+
+# Remove WolframAlpha part of speech annotations
+def stripAnnotations(text):
+   return annotationPattern.sub('', text)
+
+# Normalize text for speech synthesis. Return list of non-empty lines
+def normalizeSpeech(text):
+   if isinstance(text, str):
+      # e.g. CCSR state values, read from the CSV dump as UTF-8 byte strings
+      text = text.decode('utf-8', 'replace')
+   lines = []
+   for line in speechPattern.sub(speechReplacement, text).split('\n'):
+      line = ' '.join(line.split())
+      if line != '':
+         lines.append(line)
+   return lines
+
+
+class responseRendererClass:
+   # Response templates: name -> (CCSR command, text). Text fields are filled in by render;
+   # %(be)s is the conjugation of 'be' for %(person)s, %(reply)s is one of nlpx's canned replies
+   templates = {'reply':           ('say', '%(reply)s'),
+                'canDo':           ('say', '%(reply)s I can'),
+                'lookUp':          ('say', 'let me look that up for you'),
+                'answer':          ('say', '%(text)s'),
+                'state':           ('say', '%(phrase)s %(be)s %(state)s'),
+                'unknownState':    ('say', "Sorry, I don't know how %(phrase)s %(be)s"),
+                'locality':        ('say', '%(phrase)s %(be)s %(locality)s'),
+                'unknownLocality': ('say', "Sorry, I don't know where %(phrase)s %(be)s"),
+                'unknown':         ('say', "Sorry, I don't know %(phrase)s"),
+                'property':        ('say', '%(owner)s %(name)s is %(value)s'),
+                'unknownProperty': ('say', "I don't know what my %(name)s is"),
+                'cantTell':        ('say', "sorry, I can't tell you much about %(phrase)s"),
+                'cantDo':          ('say', "I'm afraid I can't do that. I don't know how to %(verb)s"),
+                'noAnswer':        ('say', "Sorry, I can't answer that right now"),
+                'notUnderstood':   ('say', "sorry, I don't understand")}
+
+   # Templates saying nlpx doesn't know the answer
+   unanswered = ('unknownState', 'unknownLocality', 'unknown', 'unknownProperty', 'cantTell', 'cantDo', 'noAnswer', 'notUnderstood')
+
+   # Fields holding free text from the user, memory or the cloud. These are normalized for speech
+   freeText = ('phrase', 'state', 'locality', 'name', 'value', 'verb', 'text')
+
+   def __init__(self, conjugate):
+      self.conjugateVerb = conjugate   # e.g. pattern.en.conjugate, only called once per (verb, person)
+      self.conjugations = {}
+
+   def conjugate(self, verb, person):
+      key = (verb, person)
+      if key not in self.conjugations:
+         self.conjugations[key] = self.conjugateVerb(verb, person)
+      return self.conjugations[key]
+
+   # Return message tuple for 'template', e.g. ('say', 'the cat is yellow')
+   def render(self, template, **values):
+      command, text = self.templates[template]
+      for field in self.freeText:
+         if field in values:
+            values[field] = ' '.join(normalizeSpeech(values[field]))
+      if 'person' in values:
+         values['be'] = self.conjugate('be', values['person'])
+      return (command, text % values)
@@ -0,0 +1,364 @@
+#!/usr/bin/python
+
+
+# Benchmark for nlpx: replay a labeled corpus of utterances (nlpbench_corpus.txt) through
+# ccsrNlpClass.nlpParse and report per-stage latency percentiles and utterances per second.
+# Everything runs locally: WolframAlpha is replaced by a fake HTTP server, the CCSR fifos by
+# an in-memory stub, and CCSR state comes from the bundled ccsrState_dump.csv.
+# Speech text normalization and response rendering (nlp_text.py) are also measured on their own,
+# with a large multi-line WolframAlpha answer, and batch mode (nlpParseMany, without cloud lookups)
+# with 1 and with -j worker processes, to check how parsing scales with cores.
+# Results can be stored as a baseline; later runs are compared against it to catch regressions.
+#
+# >> python nlpbench.py -i 20 --save     run 20 passes over the corpus and store the baseline
+# >> python nlpbench.py -i 20            run and compare against the stored baseline
+
+import sys
+import getopt
+import time
+import random
+import json
+import threading
+import os
+import multiprocessing
+import BaseHTTPServer
+
+import nlpx
+from nlpx import ccsrNlpClass
+from nlp_sink import fifoSinkClass
+from nlp_text import normalizeSpeech
+
+corpusFile   = 'nlpbench_corpus.txt'
+baselineFile = 'nlpbench_baseline.json'
+
+# Canned WolframAlpha reply: a 'Result' pod, so wolframAlphaAPI runs its full text normalization
+wolframReply = """<?xml version='1.0' encoding='UTF-8'?>
+<queryresult success='true'>
+ <pod title='Input interpretation'>
+  <subpod title=''><plaintext>benchmark query</plaintext></subpod>
+ </pod>
+ <pod title='Result'>
+  <subpod title=''><plaintext>noun the answer is 42; measured at 72 F and 50% humidity
+wind 10 mph from the north</plaintext></subpod>
+ </pod>
+</queryresult>
+"""
+
+# Stages timed by the benchmark: (object attribute, stage name). Stages nest, e.g. 'fifo'
+# is part of 'updateCCSRStatus', which is part of 'nlpParse'
+timedStages = (('parsetree', 'parsetree'),
+               ('sentenceType', 'sentenceType'),
+               ('updateCCSRStatus', 'updateCCSRStatus'),
+               ('wolframAlphaAPI', 'wolframAlphaAPI'),
+               ('response', 'fifo'))
+
+# Lines of a large multi-line answer, as WolframAlpha returns for e.g. weather or unit queries
+textLines = (u'noun the answer is approx. 42; measured at 72 \xb0F and 50% humidity',
+             u'wind 10 mph from the north, gusts up to 25 km/h',
+             u'population: 8.4 million (2014 estimate) & area 784 km',
+             u'e.g. mass 1.2 kg \xb1 0.1 kg; price $ 19.99 or \xa3 15')
+
+percentiles = (50, 90, 99)
+
+
+# Local stand-in for api.wolframalpha.com, with an optional artificial latency
+class fakeWolframHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+   latency = 0.0
+
+   def do_GET(self):
+      time.sleep(self.latency)
+      self.send_response(200)
+      self.send_header('Content-Type', 'text/xml')
+      self.end_headers()
+      self.wfile.write(wolframReply)
+
+   def log_message(self, format, *args):
+      pass
+
+class fakeWolframServerClass:
+   def __init__(self, latency=0.0):
+      fakeWolframHandler.latency = latency
+      self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), fakeWolframHandler)
+      self.url = 'http://127.0.0.1:%d/v2/query' % self.server.server_address[1]
+      self.thread = threading.Thread(target=self.server.serve_forever)
+      self.thread.daemon = True
+      self.thread.start()
+
+   def stop(self):
+      self.server.shutdown()
+
+
+# In-memory stand-in for the CCSR nlp fifos: every message is acknowledged immediately
+class fifoStubClass:
+   def __init__(self):
+      self.messages = 0
+
+   def write(self, m):
+      self.messages = self.messages + 1
+
+   def flush(self):
+      pass
+
+   def readline(self):
+      return 'ok\n'
+
+
+# Collects latency samples per stage
+class stageTimerClass:
+   def __init__(self):
+      self.samples = {}
+      self.types = []      # sentence types returned by sentenceType during the current utterance
+
+   def add(self, stage, t):
+      if stage not in self.samples:
+         self.samples[stage] = []
+      self.samples[stage].append(t)
+
+   # Replace obj.name by a wrapper that records the latency of every call under 'stage'
+   def wrap(self, obj, name, stage):
+      f = getattr(obj, name)
+      def timed(*args, **kwargs):
+         start = time.time()
+         try:
+            result = f(*args, **kwargs)
+         finally:
+            self.add(stage, time.time() - start)
+         if name == 'sentenceType':
+            self.types.append(result)
+         return result
+      setattr(obj, name, timed)
+
+
+# Return the p-th percentile of a list of samples (nearest rank)
+def percentile(samples, p):
+   s = sorted(samples)
+   return s[int(round(p / 100.0 * (len(s) - 1)))]
+
+def summarize(samples):
+   summary = {'count': len(samples), 'max': max(samples)}
+   for p in percentiles:
+      summary['p%d' % p] = percentile(samples, p)
+   return summary
+
+# Read corpus file: list of (expected sentence type, utterance)
+def readCorpus(fileName):
+   corpus = []
+   for line in open(fileName, 'r'):
+      line = line.rstrip('\n')
+      if line.strip() == '' or line.startswith('#'):
+         continue
+      label, utterance = line.split('\t', 1)
+      corpus.append((label, utterance))
+   return corpus
+
+def runBenchmark(corpus, iterations, wolframLatency, seed):
+   random.seed(seed)
+   wolfram = fakeWolframServerClass(wolframLatency)
+   # Always the bundled state dump, never a live one on the robot
+   s = ccsrNlpClass(False, 'BENCHMARK', '0', False, stateDumpFile=nlpx.ccsrStateDumpFileDebug)
+   s.wolframURL = wolfram.url
+   s.useFifos = True
+   s.wfifo = s.rfifo = fifoStubClass()
+   s.fifo = fifoSinkClass(s.wfifo, s.rfifo, s.metrics)
+   s.sinks = [s.fifo]
+   # Model load time is reported by nlpcmd's startup report, keep it out of the measurements
+   s.warmup(background=False)
+
+   timer = stageTimerClass()
+   timer.wrap(nlpx.en, 'parsetree', 'parsetree')       # shadows pattern.en.parsetree on the lazy module
+   timer.wrap(nlpx.sentenceAnalysisClass, 'sentenceType', 'sentenceType')
+   for name, stage in timedStages[2:]:
+      timer.wrap(s, name, stage)
+
+   perType = {}
+   mismatches = {}
+   errors = {}
+   # nlpx prints every response, keep the report readable
+   stdout = sys.stdout
+   sys.stdout = open(os.devnull, 'w')
+   try:
+      start = time.time()
+      for i in range(iterations):
+         for label, utterance in corpus:
+            timer.types = []
+            t = time.time()
+            try:
+               s.nlpParse(utterance)
+            except Exception, e:
+               errors[utterance] = errors.get(utterance, 0) + 1
+               continue
+            t = time.time() - t
+            timer.add('nlpParse', t)
+            if label not in perType:
+               perType[label] = []
+            perType[label].append(t)
+            if len(timer.types) == 0 or timer.types[0] != label:
+               mismatches[utterance] = str(timer.types[0] if timer.types else None)
+      elapsed = time.time() - start
+   finally:
+      sys.stdout.close()
+      sys.stdout = stdout
+      wolfram.stop()
+
+   result = {'utterances': iterations * len(corpus),
+             'elapsed': elapsed,
+             'throughput': iterations * len(corpus) / elapsed,
+             'stages': {},
+             'types': {},
+             'mismatches': mismatches,
+             'errors': errors}
+   for stage in timer.samples:
+      result['stages'][stage] = summarize(timer.samples[stage])
+   for label in perType:
+      result['types'][label] = summarize(perType[label])
+   return result
+
+# Measure normalizeSpeech and response rendering throughput on an answer of 'lines' lines
+def runTextBenchmark(lines, iterations):
+   text = u'\n'.join([textLines[i % len(textLines)] for i in range(lines)])
+   start = time.time()
+   for i in range(iterations):
+      normalizeSpeech(text)
+   normalizeElapsed = time.time() - start
+
+   renders = iterations * lines
+   start = time.time()
+   for i in range(renders):
+      nlpx.renderer.render('state', phrase='the cat', person='3sg', state='yellow')
+   renderElapsed = time.time() - start
+
+   return {'lines': iterations * lines,
+           'linesPerSecond': iterations * lines / normalizeElapsed,
+           'megabytesPerSecond': iterations * len(text.encode('utf-8')) / normalizeElapsed / 1e6,
+           'rendersPerSecond': renders / renderElapsed}
+
+# Measure nlpParseMany throughput with 1 and with 'jobs' worker processes. The rate is taken from
+# the first to the last result, so pool start-up and model loading are left out
+def runBatchBenchmark(corpus, iterations, jobs, seed):
+   result = {'jobs': jobs, 'lines': iterations * len(corpus), 'throughput': {}}
+   stdout = sys.stdout
+   sys.stdout = open(os.devnull, 'w')
+   try:
+      for processes in sorted(set([1, jobs])):
+         s = ccsrNlpClass(False, 'BENCHMARK', '0', False, stateDumpFile=nlpx.ccsrStateDumpFileDebug)
+         lines = (utterance for i in range(iterations) for label, utterance in corpus)
+         first = None
+         n = 0
+         for r in s.nlpParseMany(lines, processes, seed=seed, cloud=False):
+            n = n + 1
+            if first == None:
+               first = time.time()
+         result['throughput'][str(processes)] = (n - 1) / max(time.time() - first, 1e-6)
+   finally:
+      sys.stdout.close()
+      sys.stdout = stdout
+   result['speedup'] = result['throughput'][str(jobs)] / result['throughput']['1']
+   return result
+
+def printSummary(name, summary):
+   line = '  %-20s n=%-6d' % (name, summary['count'])
+   for p in percentiles:
+      line = line + ' p%d=%8.2fms' % (p, summary['p%d' % p] * 1000)
+   print line + ' max=%8.2fms' % (summary['max'] * 1000)
+
+def printReport(result):
+   print '%d utterances in %.2fs: %.1f utterances/s' % (result['utterances'], result['elapsed'], result['throughput'])
+   print 'stage latency:'
+   for stage in ['nlpParse'] + [stage for name, stage in timedStages]:
+      if stage in result['stages']:
+         printSummary(stage, result['stages'][stage])
+   print 'nlpParse latency per sentence type:'
+   for label in sorted(result['types']):
+      printSummary(label, result['types'][label])
+   for utterance in sorted(result['mismatches']):
+      print 'warning: "%s" classified as %s' % (utterance, result['mismatches'][utterance])
+   for utterance in sorted(result['errors']):
+      print 'error: "%s" raised an exception %d times' % (utterance, result['errors'][utterance])
+   if 'batch' in result:
+      batch = result['batch']
+      print 'batch: %d lines, 1 process %.1f lines/s, %d processes %.1f lines/s, speedup %.2f (%.0f%% of linear)' % (batch['lines'], batch['throughput']['1'], batch['jobs'], batch['throughput'][str(batch['jobs'])], batch['speedup'], batch['speedup'] / batch['jobs'] * 100)
+   if 'text' in result:
+      text = result['text']
+      print 'speech text: %d lines normalized, %.0f lines/s, %.1f MB/s, %.0f responses rendered/s' % (text['lines'], text['linesPerSecond'], text['megabytesPerSecond'], text['rendersPerSecond'])
+
+# Compare result against baseline. Return list of regression messages. Differences below
+# 'floor' seconds are treated as timer noise
+def compareBaseline(result, baseline, tolerance, floor=0.0005):
+   regressions = []
+   for stage in baseline['stages']:
+      if stage not in result['stages']:
+         continue
+      for p in percentiles:
+         key = 'p%d' % p
+         old = baseline['stages'][stage][key]
+         new = result['stages'][stage][key]
+         if new > old * (1 + tolerance) and new - old > floor:
+            regressions.append('%s %s: %.2fms -> %.2fms' % (stage, key, old * 1000, new * 1000))
+   if result['throughput'] < baseline['throughput'] / (1 + tolerance):
+      regressions.append('throughput: %.1f -> %.1f utterances/s' % (baseline['throughput'], result['throughput']))
+   if 'batch' in baseline and 'batch' in result:
+      for processes in baseline['batch']['throughput']:
+         old = baseline['batch']['throughput'][processes]
+         new = result['batch']['throughput'].get(processes)
+         if new != None and new < old / (1 + tolerance):
+            regressions.append('batch throughput with %s processes: %.1f -> %.1f lines/s' % (processes, old, new))
+      if result['batch']['jobs'] == baseline['batch']['jobs'] and result['batch']['speedup'] < baseline['batch']['speedup'] / (1 + tolerance):
+         regressions.append('batch speedup with %d processes: %.2f -> %.2f' % (result['batch']['jobs'], baseline['batch']['speedup'], result['batch']['speedup']))
+   if 'text' in baseline and 'text' in result:
+      for key in ('linesPerSecond', 'rendersPerSecond'):
+         if result['text'][key] < baseline['text'][key] / (1 + tolerance):
+            regressions.append('speech text %s: %.0f -> %.0f' % (key, baseline['text'][key], result['text'][key]))
+   return regressions
+
+
+if __name__ == '__main__':
+   iterations = 10
+   wolframLatency = 0.0
+   tolerance = 0.2
+   seed = 0
+   save = False
+   lines = 1000         # lines of the answer used for the speech text benchmark
+   jobs = multiprocessing.cpu_count()   # worker processes for the batch benchmark
+
+   try:
+      opts, args = getopt.getopt(sys.argv[1:], "hi:w:t:c:b:sl:j:", ["help", "iterations=", "wolfram-latency=", "tolerance=", "corpus=", "baseline=", "save", "text-lines=", "jobs="])
+   except getopt.GetoptError:
+      print 'nlpbench.py -i <iterations> -w <wolfram latency ms> -t <tolerance> -c <corpus> -b <baseline> -s -l <speech text lines> -j <batch processes>'
+      sys.exit(2)
+   for opt, arg in opts:
+      if opt in ("-h", "--help"):
+         print 'nlpbench.py -i <iterations> -w <wolfram latency ms> -t <tolerance> -c <corpus> -b <baseline> -s -l <speech text lines> -j <batch processes>'
+         sys.exit()
+      elif opt in ("-i", "--iterations"):
+         iterations = int(arg)
+      elif opt in ("-w", "--wolfram-latency"):
+         wolframLatency = float(arg) / 1000
+      elif opt in ("-t", "--tolerance"):
+         tolerance = float(arg)
+      elif opt in ("-c", "--corpus"):
+         corpusFile = arg
+      elif opt in ("-b", "--baseline"):
+         baselineFile = arg
+      elif opt in ("-s", "--save"):
+         save = True
+      elif opt in ("-l", "--text-lines"):
+         lines = int(arg)
+      elif opt in ("-j", "--jobs"):
+         jobs = int(arg)
+
+   result = runBenchmark(readCorpus(corpusFile), iterations, wolframLatency, seed)
+   result['text'] = runTextBenchmark(lines, iterations)
+   result['batch'] = runBatchBenchmark(readCorpus(corpusFile), iterations, jobs, seed)
+   printReport(result)
+   if save:
+      json.dump(result, open(baselineFile, 'w'), indent=1, sort_keys=True)
+      print 'baseline saved to ' + baselineFile
+   elif os.path.isfile(baselineFile):
+      regressions = compareBaseline(result, json.load(open(baselineFile, 'r')), tolerance)
+      for r in regressions:
+         print 'REGRESSION ' + r
+      if len(regressions) > 0:
+         sys.exit(1)
+      print 'no regressions against ' + baselineFile
+   else:
+      print 'no baseline found, run with --save to create ' + baselineFile
@@ -8,33 +8,43 @@
 import sys
 import getopt
 import re
-from pattern.en import parse
-from pattern.en import pprint
-from pattern.en import parsetree
-from pattern.en import wordnet
-from pattern.en import pluralize, singularize
-from pattern.en import conjugate, lemma, lexeme
+import json
 
 from nlpx import ccsrNlpClass
+from nlp_slow import slowRecorderClass
+from nlp_hedge import hedgedBrainClass
 
 loop = True         # If true, we continuously read and parse
 brain = 'nlpxCCSR'  # By default, use nlpxCCSR python module as NLP brain. We can
                     # set this to 'ANNA' to use the remote brain API at
                     # http://droids.homeip.net/RoboticsWeb/
+                    # 'hedged' asks both and uses the first confident answer
+hedgeDelay = 0.0    # seconds before the remote brain is asked in hedged mode
 debug = True
 #debug = False
+metrics = False     # If true, collect pipeline metrics and export them next to the CCSR state dump
+slowThreshold = None   # If set (ms), trace every utterance and record the ones slower than this
+slowDir = 'slow_utterances'
+profileRate = 0     # With -s, also run 1 in profileRate utterances under cProfile (about 2x slower), 0: never.
+                    # Recorded utterances always get a cheap sampled profile
+batchFile = None    # If set, parse this transcript in batch mode and write the results as json lines
+batchOut = None     # batch results file, default <batchFile>.json
+processes = None    # batch worker processes, default one per core
+cloud = True        # If false, batch mode doesn't query WolframAlpha (much faster, answers are left out)
 #brain = 'ANNA'
 #mode = 'poll'
 mode = 'audioCapture'
 
 try:
-   opts, args = getopt.getopt(sys.argv[1:],"hnad",["help","noloop", "anna", "debug"])
+   opts, args = getopt.getopt(sys.argv[1:],"hnadms:b:j:H:",["help","noloop", "anna", "debug", "metrics", "slow=", "slow-dir=", "profile-rate=", "batch=", "jobs=", "out=", "no-cloud", "hedge="])
 except getopt.GetoptError:
    print 'nlp.py -h -l -a'
    sys.exit(2)
 for opt, arg in opts:
    if opt == '-h':
       print 'nlp.py'
+      print '  -s <ms>              record utterances slower than <ms> with their stage timings and sampled profile (cheap)'
+      print '  --profile-rate <n>   with -s, also run 1 in <n> utterances under cProfile, which makes them about 2x slower'
       sys.exit()
    elif opt in ("-n"):
       loop = False
@@ -42,21 +52,82 @@ for opt, arg in opts:
       brain = 'ANNA'
    elif opt in ("-d"):
       debug = True
+   elif opt in ("-m", "--metrics"):
+      metrics = True
+   elif opt in ("-s", "--slow"):
+      slowThreshold = float(arg)
+   elif opt == "--slow-dir":
+      slowDir = arg
+   elif opt == "--profile-rate":
+      profileRate = int(arg)
+   elif opt in ("-b", "--batch"):
+      batchFile = arg
+   elif opt in ("-j", "--jobs"):
+      processes = int(arg)
+   elif opt == "--no-cloud":
+      cloud = False
+   elif opt == "--out":
+      batchOut = arg
+   elif opt in ("-H", "--hedge"):
+      brain = 'hedged'
+      hedgeDelay = float(arg) / 1000
 appID = 'T3H9JX-RQQ2273TJ9'        # Fill in your own Wolfram AppID here
 robotKey = '59742'
 useFifos = False     # Only set True if integrated with CCSR robot platform
-s = ccsrNlpClass(useFifos, appID, robotKey, debug)
+
+if batchFile != None:
+   s = ccsrNlpClass(False, appID, robotKey, False, metrics)
+   if batchOut == None:
+      batchOut = batchFile + '.json'
+   out = open(batchOut, 'w')
+   lines = 0
+   errors = 0
+   for result in s.nlpParseMany(open(batchFile, 'r'), processes, seed=0, cloud=cloud):
+      out.write(json.dumps(result) + '\n')
+      lines = lines + 1
+      if result['error'] != None:
+         errors = errors + 1
+   out.close()
+   print '%d lines parsed, %d errors, results in %s' % (lines, errors, batchOut)
+   sys.exit()
+
+s = ccsrNlpClass(useFifos, appID, robotKey, debug, metrics)
+if metrics:
+   s.startMetricsExport()
+parser = s
+if slowThreshold != None:
+   # Slow utterances are saved in slowDir, summarize them with nlpslow.py
+   parser = slowRecorderClass(s, slowThreshold / 1000, slowDir, profileRate=profileRate)
+if brain == 'hedged':
+   hedge = hedgedBrainClass(s, hedgeDelay)
+if brain in ('nlpxCCSR', 'hedged'):
+   # Load the parser models in the background while we wait for the first question
+   s.warmup()
+
+# Yield input lines until end of input, so nlpcmd.py can also be used in a pipeline
+def readLines():
+   while (1):
+      if(mode=='poll'):
+         yield ''
+      else:
+         line = sys.stdin.readline()
+         if line == '':
+            return
+         yield line
 
 print 'nplxCCSR v0.1: type a question...'
-while (1):
-   if(mode=='poll'):
-      line = ''
-   else:
-      line = sys.stdin.readline()
+for line in readLines():
    print brain
    if brain == 'nlpxCCSR':
-      s.nlpParse(line)
+      firstUtterance = s.startup['firstUtterance'] == None
+      parser.nlpParse(line)
+      if debug and firstUtterance:
+         print 'startup: ' + s.startupReport()
    elif brain == 'ANNA':
       s.remoteBrain(line)
+   elif brain == 'hedged':
+      hedge.ask(line)
+      if debug:
+         print 'hedge: ' + hedge.statsReport()
    if not loop:
       break
@@ -0,0 +1,277 @@
+#!/usr/bin/python
+
+
+# nlpx network server: one process serving many robots. Each connection is a session with its
+# own ccsrNlpClass, so memory and the 'I' concept are per robot. The pattern.en parser runs in a
+# shared pool of worker processes (CPU-bound, see nlp_batch.py), and response generation, which
+# may wait on WolframAlpha, runs in a small pool of responder threads. Networking is done by a
+# single asyncore event loop.
+#
+# Protocol: the robot sends one utterance per line, the server answers with one CCSR command per
+# line ('say Hi there.', 'facial 14', ...), ending with 'listen'. Utterances of a session are
+# answered in order. A session that has more than -q utterances queued, or isn't reading its
+# responses, isn't read from until it catches up (backpressure).
+# Answers that depend on the robot's state (battery, temperature, mood, ...) start with a
+# 'dump csv' line. The robot replies with an '@state' line holding its CSV state dump, rows
+# separated by ';'. Speech text never starts with '@', so this can't be mistaken for an utterance:
+#    @state battery,83,percent;temperature,21,degrees;happiness,100;arousal,50
+# A robot may also push an '@state' line at any time. The state goes into the session's own 'I'
+# concept. If the robot doesn't reply within -w seconds, its last known state is used. While a
+# session waits for its robot's state, its response generator is parked; the responder threads
+# keep serving the other sessions.
+#
+# >> python nlpserver.py -p 8750 -j 4 -t 4
+
+import sys
+import getopt
+import os
+import time
+import socket
+import asyncore
+import asynchat
+import threading
+import Queue
+import collections
+import multiprocessing
+
+from nlpx import ccsrNlpClass, ccsrStatusRequest
+from nlp_batch import initWorker, parseWorker, rebuildText
+from nlp_sink import formatMessage
+
+# Starts a line with the robot's state, see the protocol above
+stateMarker = '@state'
+
+
+# Lets other threads run a function in the asyncore loop thread, the only thread that may touch
+# the sessions' sockets
+class wakeupClass(asyncore.file_dispatcher):
+   def __init__(self):
+      r, self.wfd = os.pipe()
+      asyncore.file_dispatcher.__init__(self, r)    # keeps its own copy of r
+      os.close(r)
+      self.calls = Queue.Queue()
+
+   # Thread-safe: run f(*args) in the loop thread
+   def call(self, f, *args):
+      self.calls.put((f, args))
+      os.write(self.wfd, 'x')
+
+   def writable(self):
+      return False
+
+   def handle_read(self):
+      self.recv(4096)
+      while True:
+         try:
+            f, args = self.calls.get_nowait()
+         except Queue.Empty:
+            break
+         f(*args)
+
+
+# One connected robot
+class sessionClass(asynchat.async_chat):
+   def __init__(self, server, sock):
+      asynchat.async_chat.__init__(self, sock)
+      self.server = server
+      self.set_terminator('\n')
+      self.data = []
+      self.pending = collections.deque()   # utterances received, not yet answered
+      self.busy = False                    # an utterance is being parsed or answered
+      # No state dump file on this host: the robot sends its state over the connection
+      self.nlp = ccsrNlpClass(False, server.appID, server.robotKey, False, stateDumpFile=None)
+      self.nlp.sinks = []                  # responses are sent over the connection instead
+      self.parked = None                   # response stream waiting for the robot's state
+      self.stateDeadline = None            # time the parked stream is resumed without a new state
+      self.pushedState = None              # last state pushed by the robot, not used yet
+      self.utterances = 0
+
+   def collect_incoming_data(self, data):
+      self.data.append(data)
+
+   def found_terminator(self):
+      line = ''.join(self.data).rstrip('\r')
+      self.data = []
+      if line.startswith(stateMarker):
+         state = line[len(stateMarker):].strip().replace(';', '\n')
+         if self.parked != None:
+            self.resumeParked(state)
+         else:
+            self.pushedState = state
+         return
+      self.pending.append(line)
+      self.next()
+
+   # Backpressure: don't read more while too many utterances are queued or responses unsent,
+   # unless the robot's state reply is needed to finish the current utterance
+   def readable(self):
+      if self.parked != None:
+         return True
+      return len(self.pending) < self.server.maxPending and len(self.producer_fifo) < self.server.maxOutput
+
+   # Start on the next queued utterance, one at a time so memory is updated in order
+   def next(self):
+      if self.busy or len(self.pending) == 0 or not self.connected:
+         return
+      self.busy = True
+      self.server.parse(self, self.pending.popleft())
+
+   # Runs in a responder thread: generate responses from the parse result
+   def respond(self, result):
+      tagged, tags, classification, timings = result
+      for stage, t in timings:
+         self.nlp.metrics.observe(stage, t)
+      if tagged == None:
+         self.server.wakeup.call(self.sendMessage, ('error', classification))
+         self.server.wakeup.call(self.sendMessage, ('listen', ''))
+         self.server.wakeup.call(self.done)
+      else:
+         self.resume(self.nlp.respondParsedStream(rebuildText(tagged, tags), classification))
+
+   # Runs in a responder thread: send the messages of a response stream until it asks for the
+   # robot's state, then park it (see awaitState) and free the thread
+   def resume(self, stream):
+      try:
+         for m in stream:
+            if m == ccsrStatusRequest:
+               self.server.wakeup.call(self.awaitState, stream)
+               return
+            self.server.wakeup.call(self.sendMessage, m)
+      except Exception, e:
+         self.server.wakeup.call(self.sendMessage, ('error', '%s: %s' % (e.__class__.__name__, e)))
+         self.server.wakeup.call(self.sendMessage, ('listen', ''))
+      self.server.wakeup.call(self.done)
+
+   # Ask the robot for its state. The stream is resumed by resumeParked when the state arrives,
+   # or by nlpServerClass.checkTimeouts
+   def awaitState(self, stream):
+      if not self.connected:
+         stream.close()
+         return
+      self.parked = stream
+      self.stateDeadline = time.time() + self.server.stateTimeout
+      self.sendMessage(ccsrStatusRequest)
+
+   # Hand state to this session's nlp (None: keep the last known state) and let a responder
+   # thread continue the parked stream
+   def resumeParked(self, state):
+      stream = self.parked
+      self.parked = None
+      self.stateDeadline = None
+      if state == None:
+         # No reply in time: a state pushed before the request is better than nothing
+         self.nlp.metrics.count('state.timeouts')
+         state = self.pushedState
+      self.pushedState = None
+      if state != None:
+         self.nlp.setCCSRStatus(state)
+      self.server.work.put((self.resume, (stream,)))
+
+   def sendMessage(self, m):
+      if self.connected:
+         line = formatMessage(m) + '\n'
+         if isinstance(line, unicode):
+            # pattern.en words are unicode, the connection carries UTF-8
+            line = line.encode('utf-8')
+         self.push(line)
+
+   def done(self):
+      self.busy = False
+      self.utterances = self.utterances + 1
+      self.next()
+
+   def handle_close(self):
+      self.close()
+      self.server.sessions.discard(self)
+      if self.parked != None:
+         self.parked.close()
+         self.parked = None
+
+
+class nlpServerClass(asyncore.dispatcher):
+   def __init__(self, host, port, appID, robotKey, processes=None, responders=4, maxPending=8, maxOutput=256, stateTimeout=2.0):
+      # Fork the parser workers before any threads or sockets exist
+      self.pool = multiprocessing.Pool(processes, initWorker)
+      asyncore.dispatcher.__init__(self)
+      self.appID = appID
+      self.robotKey = robotKey
+      self.maxPending = maxPending    # queued utterances per session
+      self.maxOutput = maxOutput      # unsent response lines per session
+      self.stateTimeout = stateTimeout   # seconds to wait for a robot's state reply
+      self.sessions = set()
+      self.wakeup = wakeupClass()
+      self.work = Queue.Queue()       # (function, args) for the responder threads
+      for i in range(responders):
+         t = threading.Thread(target=self.responder, name='nlpx-responder-%d' % i)
+         t.daemon = True
+         t.start()
+      self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+      self.set_reuse_addr()
+      self.bind((host, port))
+      self.listen(64)
+
+   def handle_accept(self):
+      pair = self.accept()
+      if pair != None:
+         self.sessions.add(sessionClass(self, pair[0]))
+
+   # Parse line in the worker pool, then queue the result for the responder threads
+   def parse(self, session, line):
+      self.pool.apply_async(parseWorker, (line,), callback=lambda result: self.work.put((session.respond, (result,))))
+
+   def responder(self):
+      while True:
+         f, args = self.work.get()
+         f(*args)
+
+   # Resume the parked streams of sessions whose robot didn't send its state in time
+   def checkTimeouts(self):
+      now = time.time()
+      for session in list(self.sessions):
+         if session.parked != None and session.stateDeadline <= now:
+            session.resumeParked(None)
+
+   def serve(self):
+      try:
+         while len(asyncore.socket_map) > 0:
+            asyncore.loop(timeout=0.1, use_poll=True, count=1)
+            self.checkTimeouts()
+      finally:
+         self.pool.terminate()
+
+
+if __name__ == '__main__':
+   host = ''
+   port = 8750
+   processes = None     # parser worker processes, default one per core
+   responders = 4       # responder threads
+   maxPending = 8
+   stateTimeout = 2.0   # seconds
+   appID = 'T3H9JX-RQQ2273TJ9'        # Fill in your own Wolfram AppID here
+   robotKey = '59742'
+
+   try:
+      opts, args = getopt.getopt(sys.argv[1:], "hH:p:j:t:q:w:", ["help", "host=", "port=", "jobs=", "threads=", "queue=", "state-wait="])
+   except getopt.GetoptError:
+      print 'nlpserver.py -H <host> -p <port> -j <parser processes> -t <responder threads> -q <queued utterances per session> -w <state wait s>'
+      sys.exit(2)
+   for opt, arg in opts:
+      if opt in ("-h", "--help"):
+         print 'nlpserver.py -H <host> -p <port> -j <parser processes> -t <responder threads> -q <queued utterances per session> -w <state wait s>'
+         sys.exit()
+      elif opt in ("-H", "--host"):
+         host = arg
+      elif opt in ("-p", "--port"):
+         port = int(arg)
+      elif opt in ("-j", "--jobs"):
+         processes = int(arg)
+      elif opt in ("-t", "--threads"):
+         responders = int(arg)
+      elif opt in ("-q", "--queue"):
+         maxPending = int(arg)
+      elif opt in ("-w", "--state-wait"):
+         stateTimeout = float(arg)
+
+   server = nlpServerClass(host, port, appID, robotKey, processes, responders, maxPending, stateTimeout=stateTimeout)
+   print 'nlpxCCSR server listening on port %d' % port
+   server.serve()
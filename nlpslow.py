@@ -0,0 +1,63 @@
+#!/usr/bin/python
+
+
+# Summarize the slow utterances recorded by nlpcmd.py -s <ms> (see nlp_slow.py): list the
+# worst offenders by latency with their sentence analysis, stage timings and the functions
+# that took most time according to their sampled profile, or their cProfile dump if there is one.
+#
+# >> python nlpslow.py -n 5 slow_utterances
+
+import sys
+import getopt
+import os
+import json
+import pstats
+
+from nlp_slow import slowRecorderClass
+
+directory = 'slow_utterances'
+worst = 10          # number of utterances to show
+functions = 5       # number of profile entries to show per utterance
+
+try:
+   opts, args = getopt.getopt(sys.argv[1:], "hn:f:", ["help", "worst=", "functions="])
+except getopt.GetoptError:
+   print 'nlpslow.py -n <worst> -f <functions> [directory]'
+   sys.exit(2)
+for opt, arg in opts:
+   if opt in ("-h", "--help"):
+      print 'nlpslow.py -n <worst> -f <functions> [directory]'
+      sys.exit()
+   elif opt in ("-n", "--worst"):
+      worst = int(arg)
+   elif opt in ("-f", "--functions"):
+      functions = int(arg)
+if len(args) > 0:
+   directory = args[0]
+
+records = []
+for name in slowRecorderClass.records(directory):
+   r = json.load(open(os.path.join(directory, name, 'utterance.json'), 'r'))
+   r['name'] = name
+   records.append(r)
+records.sort(key=lambda r: r['latency'], reverse=True)
+
+print '%d slow utterances in %s' % (len(records), directory)
+for r in records[:worst]:
+   print
+   print '%8.1fms  "%s"  (%s)' % (r['latency'] * 1000, r['text'], r['name'])
+   for a in r['analysis']:
+      print '   type: %s, concept: %s, chunks: %s' % (a['type'], a['concept'], a['chunks'])
+   for stage, t in r['stages']:
+      print '   %-24s %8.1fms' % (stage, t * 1000)
+   profile = os.path.join(directory, r['name'], 'profile.prof')
+   samples = os.path.join(directory, r['name'], 'samples.json')
+   if functions > 0 and os.path.isfile(profile):
+      stats = pstats.Stats(profile, stream=sys.stdout)
+      stats.sort_stats('cumulative').print_stats(functions)
+   elif functions > 0 and os.path.isfile(samples):
+      s = json.load(open(samples, 'r'))
+      print '   %d samples every %.0fms of CPU time:' % (s['samples'], s['interval'] * 1000)
+      print '   %8s %8s  function' % ('self', 'cumul')
+      for f in s['functions'][:functions]:
+         print '   %8d %8d  %s' % (f['self'], f['cumulative'], f['function'])
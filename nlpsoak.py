@@ -0,0 +1,152 @@
+#!/usr/bin/python
+
+
+# End-to-end fifo soak test for nlpx. Starts the CCSR stand-in process (ccsrsim.py) on a set of
+# private fifos, connects a ccsrNlpClass to it, and replays an utterance log at an accelerated
+# rate. Reports sustained throughput and latency; latency is measured from the time an utterance
+# is due, so time spent waiting behind earlier utterances (backpressure) is included.
+#
+# The utterance log holds one utterance per line, optionally prefixed by its time offset in
+# seconds: '12.5<TAB>how are you'. Lines without a time are spaced by -i <interval ms>.
+# nlpbench_corpus.txt can be used as well, its labels are ignored.
+#
+# >> python nlpsoak.py -r 10 -p 5 -l 5 utterances.log
+
+import sys
+import getopt
+import os
+import time
+import random
+import shutil
+import tempfile
+import subprocess
+
+from nlpx import ccsrNlpClass
+from nlpbench import fakeWolframServerClass, summarize, printSummary
+
+# Read utterance log: list of (time offset in seconds, utterance)
+def readLog(fileName, interval):
+   log = []
+   t = 0.0
+   for line in open(fileName, 'r'):
+      line = line.rstrip('\n')
+      if line.strip() == '' or line.startswith('#'):
+         continue
+      fields = line.split('\t')
+      try:
+         t = float(fields[0])
+      except ValueError:
+         t = t + interval
+      log.append((t, fields[-1]))
+   return log
+
+# Replay 'log' (which repeats every 'period' seconds) 'passes' times, 'rate' times faster than real time
+def runSoak(log, period, rate, passes, fifoDir, seed):
+   random.seed(seed)
+   wolfram = fakeWolframServerClass()
+   s = ccsrNlpClass(True, 'SOAK', '0', False, True,
+                    fifoIn=os.path.join(fifoDir, 'nlp_fifo_in'),
+                    fifoOut=os.path.join(fifoDir, 'nlp_fifo_out'),
+                    stateDumpFile=os.path.join(fifoDir, 'ccsrState_dump.csv'))
+   s.wolframURL = wolfram.url
+   s.warmup(background=False)
+
+   latency = []       # due time -> done, includes backpressure
+   service = []       # nlpParse time only
+   lag = 0.0          # worst time an utterance started after it was due
+   stdout = sys.stdout
+   sys.stdout = open(os.devnull, 'w')
+   try:
+      start = time.time()
+      for p in range(passes):
+         passStart = start + p * period / rate
+         for t, utterance in log:
+            due = passStart + t / rate
+            now = time.time()
+            if now < due:
+               time.sleep(due - now)
+            begin = time.time()
+            lag = max(lag, begin - due)
+            s.nlpParse(utterance)
+            done = time.time()
+            service.append(done - begin)
+            latency.append(done - due)
+      elapsed = time.time() - start
+   finally:
+      sys.stdout.close()
+      sys.stdout = stdout
+      s.wfifo.close()
+      s.rfifo.close()
+      wolfram.stop()
+
+   return {'utterances': len(latency),
+           'elapsed': elapsed,
+           'throughput': len(latency) / elapsed,
+           'offered': len(log) * rate / period,
+           'lag': lag,
+           'latency': summarize(latency),
+           'service': summarize(service),
+           'fifo': s.metrics.query('fifo'),
+           'messages': s.metrics.query('fifo')['count']}
+
+
+if __name__ == '__main__':
+   rate = 1.0            # replay speed-up factor
+   passes = 1
+   interval = 1.0        # seconds between utterances without a time stamp
+   simLatency = 0.0      # ccsrsim acknowledge latency (ms)
+   simJitter = 0.0
+   trafficLog = None
+   seed = 0
+   logFile = 'nlpbench_corpus.txt'
+
+   try:
+      opts, args = getopt.getopt(sys.argv[1:], "hr:p:i:l:j:o:", ["help", "rate=", "passes=", "interval=", "latency=", "jitter=", "traffic="])
+   except getopt.GetoptError:
+      print 'nlpsoak.py -r <rate> -p <passes> -i <interval ms> -l <ccsr latency ms> -j <ccsr jitter ms> -o <traffic log> [utterance log]'
+      sys.exit(2)
+   for opt, arg in opts:
+      if opt in ("-h", "--help"):
+         print 'nlpsoak.py -r <rate> -p <passes> -i <interval ms> -l <ccsr latency ms> -j <ccsr jitter ms> -o <traffic log> [utterance log]'
+         sys.exit()
+      elif opt in ("-r", "--rate"):
+         rate = float(arg)
+      elif opt in ("-p", "--passes"):
+         passes = int(arg)
+      elif opt in ("-i", "--interval"):
+         interval = float(arg) / 1000
+      elif opt in ("-l", "--latency"):
+         simLatency = float(arg)
+      elif opt in ("-j", "--jitter"):
+         simJitter = float(arg)
+      elif opt in ("-o", "--traffic"):
+         trafficLog = arg
+   if len(args) > 0:
+      logFile = args[0]
+
+   fifoDir = tempfile.mkdtemp(prefix='ccsrsim')
+   cmd = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ccsrsim.py'), '-1', '-d', fifoDir, '-l', str(simLatency), '-j', str(simJitter)]
+   if trafficLog != None:
+      cmd = cmd + ['-o', trafficLog]
+   sim = subprocess.Popen(cmd)
+   # ccsrsim creates the fifos, wait for them before nlpx opens them
+   while not os.path.exists(os.path.join(fifoDir, 'nlp_fifo_out')):
+      if sim.poll() != None:
+         print 'ccsrsim.py exited with status %d' % sim.returncode
+         sys.exit(1)
+      time.sleep(0.01)
+   log = readLog(logFile, interval)
+   try:
+      result = runSoak(log, log[-1][0] + interval, rate, passes, fifoDir, seed)
+   except:
+      sim.terminate()
+      raise
+   # ccsrsim -1 exits once nlpx closes the fifos
+   sim.wait()
+   shutil.rmtree(fifoDir)
+
+   print '%d utterances in %.2fs: %.1f utterances/s sustained, %.1f/s offered' % (result['utterances'], result['elapsed'], result['throughput'], result['offered'])
+   print '%d fifo messages, worst start lag %.1fms' % (result['messages'], result['lag'] * 1000)
+   printSummary('latency', result['latency'])
+   printSummary('nlpParse', result['service'])
+   print '  fifo round trip      n=%-6d mean=%.2fms p90<=%.2fms max=%.2fms' % (result['fifo']['count'], result['fifo']['mean'] * 1000, result['fifo']['p90'] * 1000, result['fifo']['max'] * 1000)
@@ -14,6 +14,9 @@
 
 
 
+import time
+importStart = time.time()
+
 import sys
 import getopt
 import re
@@ -21,25 +24,39 @@ import subprocess
 import csv
 import random
 import os
+import threading
 import requests
+import xml.etree.ElementTree as ET
 
 
 sys.path.insert(0, '../robotics_web')
 
-from pattern.en import parse
-from pattern.en import pprint
-from pattern.en import parsetree
-from pattern.en import wordnet
-from pattern.en import pluralize, singularize
-from pattern.en import conjugate, lemma, lexeme
-
+from nlp_lazy import lazyModuleClass
 from nlp_sa  import sentenceAnalysisClass
 from nlp_cap import capabilitiesClass
 from nlp_mem import memoryClass
-from robotics_web import roboticsWebClass
+from nlp_metrics import metricsClass
+from nlp_batch import batchParserClass, rebuildText
+from nlp_sink import toMessage, formatMessage, stdoutSinkClass, fifoSinkClass
+from nlp_text import normalizeSpeech, stripAnnotations, responseRendererClass
+
+# Heavy dependencies are only imported on first use (or by ccsrNlpClass.warmup)
+en          = lazyModuleClass('pattern.en')
+roboticsWeb = lazyModuleClass('robotics_web')
+
+# Response templates, shared by all ccsrNlpClass instances so conjugations are only looked up once
+renderer    = responseRendererClass(lambda verb, person: en.conjugate(verb, person))
+
+importTime = time.time() - importStart
 
 ccsrStateDumpFile      = '../data/ccsrState_dump.csv'
 ccsrStateDumpFileDebug = 'ccsrState_dump.csv'
+ccsrFifoIn             = '/home/root/ccsr/nlp_fifo_in'     # nlpx -> CCSR
+ccsrFifoOut            = '/home/root/ccsr/nlp_fifo_out'    # CCSR -> nlpx
+metricsFileName        = 'nlpx_metrics'    # written as .json and .csv next to the state dump
+
+# Response message asking CCSR to dump its state, see ccsrNlpClass.updateCCSRStatus
+ccsrStatusRequest      = ('dump', 'csv')
 
 EXPR_BLINK              = 0
 EXPR_TALK               = 1
@@ -62,11 +79,22 @@ EXPR_WHITELIGHT         = 16
 # main CCSR NLP Class
 class ccsrNlpClass:
 
-   def __init__(self, useFifos, appID, robotKey, debug):
+   def __init__(self, useFifos, appID, robotKey, debug, metrics=False,
+                fifoIn=ccsrFifoIn, fifoOut=ccsrFifoOut, stateDumpFile=ccsrStateDumpFile):
+      self.metrics   = metricsClass(metrics) # pipeline counters and latency histograms
       self.cap       = capabilitiesClass()   # CCSR capabilities
-      self.ccsrmem   = memoryClass()         # memory of concepts
-      self.roboticsWeb =  roboticsWebClass(robotKey, debug)
+      self.ccsrmem   = memoryClass(self.metrics)   # memory of concepts
+      self.roboticsWeb = None                # remote brain, created on first remoteBrain call
+      self.robotKey = robotKey
       self.debug = debug
+
+      # Startup timing, reported by startupReport(). All times in seconds
+      self.bootTime = time.time()
+      self.startup = {'import': importTime,        # importing nlpx and its light dependencies
+                      'ready': None,               # boot until warm-up finished
+                      'firstUtterance': None}      # latency of the first nlpParse call
+      self.warmedUp = threading.Event()
+      self.warmupThread = None
       
       # Add a concept 'I', defining CCSR identity
       self.ccsrmem.add('I')
@@ -153,18 +181,78 @@ class ccsrNlpClass:
                          
 
 
+      # Responses are delivered to each of these sinks, see nlp_sink.py
+      self.sinks = [stdoutSinkClass()]
+      self.sinkLock = threading.Lock()     # one fifo handshake at a time, e.g. with a hedged brain
       if useFifos:
-         self.wfifo = open('/home/root/ccsr/nlp_fifo_in', 'w')
-         self.rfifo = open('/home/root/ccsr/nlp_fifo_out', 'r')
+         self.wfifo = open(fifoIn, 'w')
+         self.rfifo = open(fifoOut, 'r')
+         self.fifo = fifoSinkClass(self.wfifo, self.rfifo, self.metrics)
+         self.sinks.append(self.fifo)
 
+      self.stateDumpFile = stateDumpFile   # CSV file CCSR dumps its state to on 'dump csv', None if there is none
+      self.ccsrStatus = None     # CCSR state rows handed in by setCCSRStatus, used instead of stateDumpFile
       self.wolframID = appID     # Wolfram API App ID
+      self.wolframURL = 'http://api.wolframalpha.com/v2/query'   # Wolfram API endpoint
       self.useFifos = useFifos   # IF True, we pipe responses to CCSR. False in debg mode
       self.cmdResponse = ''      # We store CCSR command response here, unused for now
+      self.lastAnalysis = []     # (sentenceAnalysisClass, sentence type) for each sentence of the last nlpParse call
+      self.lastAnswered = True   # False if nlpx didn't know the answer to (part of) the last nlpParse call
+      self.skippedQueries = None # If a list, WolframAlpha isn't queried; the queries are added here instead
 
    def remoteBrain(self, text):
-      for el in self.roboticsWeb.brainAPI(text):
+      for el in self.remoteBrainAnswer(text):
          self.response(el)
 
+   # Return the remote brain's answer to text as a list of CCSR commands, without sending them
+   def remoteBrainAnswer(self, text):
+      if self.roboticsWeb == None:
+         self.roboticsWeb = roboticsWeb.roboticsWebClass(self.robotKey, self.debug)
+      self.metrics.count('remoteBrain.calls')
+      with self.metrics.timer('remoteBrain'):
+         return list(self.roboticsWeb.brainAPI(text))
+
+   # Periodically write metrics to nlpx_metrics.json/.csv, in the same directory as the CCSR state dump
+   def startMetricsExport(self, interval=60):
+      directory = os.path.dirname(self.stateDumpFile)
+      if not os.path.isdir(directory):
+         directory = os.path.dirname(ccsrStateDumpFileDebug)
+      self.metrics.startExport(os.path.join(directory, metricsFileName), interval)
+
+   # Preload the pattern.en tagger, lexicon and WordNet so the first utterance doesn't pay
+   # the model load cost. By default this runs in a background thread started at boot;
+   # nlpParse waits for it to finish rather than loading the models a second time.
+   def warmup(self, background=True):
+      if self.warmupThread != None:
+         return
+      if background:
+         self.warmupThread = threading.Thread(target=self.warmupModels, name='nlpx-warmup')
+         self.warmupThread.daemon = True
+         self.warmupThread.start()
+      else:
+         self.warmupThread = threading.current_thread()
+         self.warmupModels()
+
+   def warmupModels(self):
+      try:
+         en.parsetree('hello, how are you', relations=True, lemmata=True)   # tagger, chunker and lexicon
+         en.wordnet.synsets('robot')                                          # WordNet corpus
+         en.conjugate('be', '3sg')                                            # verb tables
+      finally:
+         self.startup['ready'] = time.time() - self.bootTime
+         self.warmedUp.set()
+
+   # Return a printable report of startup timing: import time, time-to-ready and first-utterance latency
+   def startupReport(self):
+      report = 'import: %.3fs' % self.startup['import']
+      report = report + ', pattern.en import: %.3fs' % en.loadTime
+      for key, label in (('ready', 'time-to-ready'), ('firstUtterance', 'first utterance')):
+         if self.startup[key] == None:
+            report = report + ', ' + label + ': n/a'
+         else:
+            report = report + ', ' + label + ': %.3fs' % self.startup[key]
+      return report
+
    def randomizedResponseVariation(self, response):
        idx = random.randint(0, len(self.responseVariations[response])-1)
        return self.responseVariations[response][idx]
@@ -186,8 +274,18 @@ class ccsrNlpClass:
    # e.g. 'what is the tallest building in the world' =>
    #  ('xxx tower', '3000ft')
    def wolframAlphaAPI(self, sa):
-      url = 'http://api.wolframalpha.com/v2/query?input=' + self.createWolframAlphaQuery(sa) + '&appid=' + self.wolframID + '&format=plaintext'
-      print url
+      if self.skippedQueries != None:
+         # Batch replay without cloud lookups: note the query, answer nothing
+         self.skippedQueries.append(self.createWolframAlphaQuery(sa))
+         return []
+      self.metrics.count('wolframAlphaAPI.calls')
+      with self.metrics.timer('wolframAlphaAPI'):
+         return self.queryWolframAlpha(sa)
+
+   def queryWolframAlpha(self, sa):
+      url = self.wolframURL + '?input=' + self.createWolframAlphaQuery(sa) + '&appid=' + self.wolframID + '&format=plaintext'
+      if self.debug:
+         print url
       r = requests.get(url)
       if r:
          # parse query XML file returned by wolfram alpha
@@ -200,12 +298,8 @@ class ccsrNlpClass:
                   # retrieve plaintext answers
                   plaintext = subpod.find('plaintext')
                   if plaintext != None:
-                     text = subpod.find('plaintext').text
-                     text = re.sub('noun ', '', text)
-                     # Filter out funny characters
-                     text = re.sub('[^A-Z0-9a-z .\\n;]', '', text)
-                     text = re.sub('; (.)', lambda pat: '. ' + pat.group(1).upper(), text)
-                     textlist = re.split('\n', text)
+                     # Spell out units and symbols, filter out funny characters
+                     textlist = normalizeSpeech(stripAnnotations(subpod.find('plaintext').text))
                      # return list of strings representign answer to query
                      return textlist
          # We havent found a known pod, just pick the second pod, a wild
@@ -217,14 +311,8 @@ class ccsrNlpClass:
                # retrieve plaintext answers
                plaintext = subpod.find('plaintext')
                if plaintext != None:
-                  # Replace a set of known symbols with words
-                  text = subpod.find('plaintext').text
-                  text = re.sub(' .F', ' degrees', text)
-                  text = re.sub('\%', ' percent', text)
-                  text = re.sub(' mph', ' miles per hour', text)
-                  # Filter out funny characters
-                  text = re.sub('[^A-Z0-9a-z \\n]', '', text)
-                  textlist = re.split('\n', text)
+                  # Spell out units and symbols, filter out funny characters
+                  textlist = normalizeSpeech(stripAnnotations(subpod.find('plaintext').text))
                   textlist.insert(0,pod.get('title'))
                   # return list of strings representign answer to query
                   return textlist
@@ -234,207 +322,344 @@ class ccsrNlpClass:
             return textlist
       else:
          print 'Error: curl command failed, only runs on linux. Query not successful'
+         self.metrics.count('wolframAlphaAPI.errors')
          return ('none')
 
-   # Respone to voice input back to CCSR process as telemetry through nlp fifo
+   # Respone to voice input back to CCSR process as telemetry through nlp fifo (and the other sinks).
+   # s is a CCSR command string ('say I am great') or a message tuple (('say', 'I am great'))
    def response(self, s):
-      m = s + '*'
-      print s
-      if self.useFifos:
-         self.wfifo.write(m)
-         self.wfifo.flush()
-         # This should block untill cmd response is received. Used to sync.
-         self.cmdResponse = self.rfifo.readline();  
+      m = toMessage(s)
+      self.sinkLock.acquire()
+      try:
+         for sink in self.sinks:
+            sink.send(m)
+         if self.useFifos:
+            self.cmdResponse = self.fifo.ack
+      finally:
+         self.sinkLock.release()
+
+   # Hand in the CCSR state as CSV text, e.g. received over a network connection instead of
+   # through the state dump file. Used by the next updateCCSRStatus
+   def setCCSRStatus(self, text):
+      self.ccsrStatus = list(csv.reader(text.splitlines()))
 
    # This function updates nlpxCCSR with the current state of the CCSR process
-   # Send cmd to CCSR to dump status in CSV file. Parse this CVS
-   # file and update the 'I' concept in ccsrmem accordinly
+   # The response stream first yields ccsrStatusRequest ('dump csv'): the consumer sends it to CCSR,
+   # which dumps its status in a CSV file, or hands in the state with setCCSRStatus. Parse this CVS
+   # and update the 'I' concept in ccsrmem accordinly
    # This function is run everytime a query is done about 'I' (e.g. how are you)
    def updateCCSRStatus(self):
-      self.response("dump csv")
-      if os.path.isfile(ccsrStateDumpFile): 
-         statusDump = open(ccsrStateDumpFile, 'r')
+      start = self.metrics.start()
+      if self.ccsrStatus != None:
+         items = self.ccsrStatus
+         self.ccsrStatus = None
+      elif self.stateDumpFile == None:
+         # No state dump, keep the last known state
+         items = []
       else:
-         print "Can't open " + ccsrStateDumpFile + ", using static debug file"
-         statusDump = open(ccsrStateDumpFileDebug, 'r')
-      csvfile = csv.reader(statusDump)
-      for item in csvfile:
+         if os.path.isfile(self.stateDumpFile): 
+            statusDump = open(self.stateDumpFile, 'r')
+         else:
+            print "Can't open " + self.stateDumpFile + ", using static debug file"
+            statusDump = open(ccsrStateDumpFileDebug, 'r')
+         items = list(csv.reader(statusDump))
+         statusDump.close()
+      for item in items:
          # Item in cvs file is list of 2 or 3 items: 'name', 'value' and optinally a 'unit' (e.g. power 100 milliwatt)
-         self.ccsrmem.concepts['I'].properties[item[0]] = [self.translateStatus[item[0]], item[1] + " " + item[2]] 
-      yEmotionMap = 3-(4*(int(self.ccsrmem.concepts['I'].properties['arousal'][1]))/255)
-      xEmotionMap = 4*(int(self.ccsrmem.concepts['I'].properties['happiness'][1]) + 255)/511
-      self.ccsrmem.concepts['I'].state = self.emotionMap[yEmotionMap][xEmotionMap]
+         if len(item) < 2:
+            continue
+         self.ccsrmem.concepts['I'].properties[item[0]] = [self.translateStatus.get(item[0], item[0]), " ".join(" ".join(item[1:]).split())]
+      # Older CCSR dumps don't contain the emotional state, keep the current mood in that case
+      if 'arousal' in self.ccsrmem.concepts['I'].properties and 'happiness' in self.ccsrmem.concepts['I'].properties:
+         yEmotionMap = 3-(4*(int(self.ccsrmem.concepts['I'].properties['arousal'][1].split()[0]))/255)
+         xEmotionMap = 4*(int(self.ccsrmem.concepts['I'].properties['happiness'][1].split()[0]) + 255)/511
+         self.ccsrmem.concepts['I'].state = self.emotionMap[yEmotionMap][xEmotionMap]
+      self.metrics.stop('updateCCSRStatus', start)
 #      if int(self.ccsrmem.concepts['I'].properties['happiness'][1]) > 0:
 #         self.ccsrmem.concepts['I'].state = 'not feeling so great'      
 #      else:
 #         self.ccsrmem.concepts['I'].state = 'great'      
 
+   # Render response template 'template', see nlp_text.py. Notes in lastAnswered if nlpx doesn't know the answer
+   def render(self, template, **values):
+      if template in renderer.unanswered:
+         self.lastAnswered = False
+      return renderer.render(template, **values)
+
    def getPersonalProperty(self, sa):
       # Question refers back to ccsr: how is 'your' X  
       if sa.getSentenceRole(sa.concept) in self.ccsrmem.concepts['I'].properties:
-         self.response("say my " + self.ccsrmem.concepts['I'].properties[sa.getSentenceRole(sa.concept)][0] + " is " + self.ccsrmem.concepts['I'].properties[sa.getSentenceRole(sa.concept)][1])
+         name, value = self.ccsrmem.concepts['I'].properties[sa.getSentenceRole(sa.concept)]
+         yield self.render('property', owner='my', name=name, value=value)
       else:
-         self.response("say I don't know what my " + sa.getSentenceRole(sa.concept) + " is ")
+         yield self.render('unknownProperty', name=sa.getSentenceRole(sa.concept))
       
    # Main function: generate a CCSR command as response to input text.
    # Text will be from google speech2text service.
    # 'how are you' => 'say I am great'
    # 'can you look left => 'say sure', 'set pantilt 180 0 20'
    def nlpParse(self, line):
-      text = parsetree(line, relations=True, lemmata=True)
+      start = time.time()
+      self.metrics.count('utterances')
+      try:
+         for m in self.nlpParseStream(line):
+            self.response(m)
+      except Exception:
+         self.metrics.count('nlpParse.errors')
+         raise
+      finally:
+         latency = time.time() - start
+         self.metrics.observe('nlpParse', latency)
+         if self.startup['firstUtterance'] == None:
+            self.startup['firstUtterance'] = latency
+
+   # Streaming version of nlpParse: a generator yielding the response messages as (command, argument)
+   # tuples, e.g. ('facial', '14'), ('say', 'Yes.'). Messages are computed lazily, so the caller can
+   # act on the first one (e.g. start speech synthesis) while later ones are still being worked out.
+   # The stream includes ccsrStatusRequest when the answer depends on the CCSR state. The consumer
+   # must act on it before asking for the next message: send it to CCSR and wait for the acknowledge
+   # (as nlpParse does through the fifo sink), or hand in the state with setCCSRStatus.
+   def nlpParseStream(self, line):
+      if self.warmupThread != None:
+         # Don't race the warm-up thread loading the same models
+         self.warmedUp.wait()
+      self.lastAnalysis = []
+      self.lastAnswered = True
+      start = self.metrics.start()
+      text = en.parsetree(line, relations=True, lemmata=True)
+      self.metrics.stop('parsetree', start)
       for sentence in text:
          sa = sentenceAnalysisClass(sentence, self.debug)
+         start = self.metrics.start()
          st = sa.sentenceType()
+         self.metrics.stop('sentenceType', start)
+         self.metrics.count('sentences')
+         self.lastAnalysis.append((sa, st))
          if sa.debug:
             print st
             print 'concept: ' + sa.concept
-         # Question state: 'how is X'
-         if st == 'questionState':
-            self.updateCCSRStatus()
-            if sa.is2ndPersonalPronounPosessive('OBJ'):
-               # Question refers back to ccsr: how is 'your' X. Look up CCSR's personal property
-               self.getPersonalProperty(sa)
-            elif self.ccsrmem.known(sa.getSentenceRole(sa.concept)):
-               # if we know anything about the concept, we rely on CCSR memory
-               if self.ccsrmem.concepts[sa.getSentenceRole(sa.concept)].state == 'none':
-                  self.response("say Sorry, I don't know how " + sa.getSentencePhrase(sa.concept) + ' ' + conjugate('be', self.ccsrmem.concepts[sa.getSentenceRole(sa.concept)].person))
-               else:   
-                  self.response("say " + sa.getSentencePhrase(sa.concept) + " " + conjugate('be', self.ccsrmem.concepts[sa.getSentenceRole(sa.concept)].person) + " " + self.ccsrmem.concepts[sa.getSentenceRole(sa.concept)].state)
+         for m in self.respondSentence(sa, st):
+            yield m
+      yield ('listen', '')
+
+   # Batch version of nlpParse, e.g. to replay a recorded transcript. Lines are parsed and classified
+   # in a pool of 'processes' worker processes, 'chunksize' lines at a time. Responses are generated
+   # here, in input order, so memory ends up the same as after calling nlpParse on each line.
+   # Only parsing scales with the number of processes: response generation is serial, and each
+   # WolframAlpha lookup blocks it for a network round trip. With cloud=False WolframAlpha isn't
+   # queried; the queries are listed per line instead.
+   # Responses are not printed or sent to CCSR (debug output only appears with debug=True), so CCSR
+   # state is read from stateDumpFile once, up front.
+   # lines may be any iterable, e.g. an open transcript file: only a few chunks per process are read
+   # ahead. A generator, yielding a dict per line, in input order, as soon as it is answered:
+   #   {'text': 'how are you', 'types': ['questionState'], 'responses': ['dump csv', 'say I am great', 'listen'],
+   #    'skippedQueries': [], 'error': None}
+   # Responses go nowhere until the generator is exhausted or closed, so don't call nlpParse meanwhile.
+   def nlpParseMany(self, lines, processes=None, chunksize=16, seed=None, cloud=True):
+      if seed != None:
+         # Fix the response variations, so replaying the same transcript gives the same result
+         random.seed(seed)
+      parser = batchParserClass(processes, chunksize)
+      sinks = self.sinks
+      stateDumpFile = self.stateDumpFile
+      self.sinks = []
+      try:
+         self.updateCCSRStatus()
+         self.stateDumpFile = None      # keep the state read above
+         for line, (tagged, tags, classification, timings) in parser.parse(lines):
+            result = {'text': line.strip(), 'types': [], 'responses': [], 'skippedQueries': [], 'error': None}
+            self.metrics.count('utterances')
+            for stage, t in timings:
+               self.metrics.observe(stage, t)
+            if not cloud:
+               self.skippedQueries = result['skippedQueries']
+            if tagged == None:
+               result['error'] = classification
             else:
-               if sa.complexQuery():
-                  # Nothing is knows about the concept, and the query is 'complex', let's ask the cloud
-                  self.response("say let me look that up for you")
-                  # Looking up stuff makes CCSR happy and excited 
-                  self.response("mood 50 50")
-                  for result in self.wolframAlphaAPI(sa):
-                     self.response("say " + result)              
-               else:
-                  self.response("say Sorry, I don't know " + sa.getSentencePhrase(sa.concept))
-         # Confirm state: 'is X Y'
-         elif st == 'confirmState':
-            if self.ccsrmem.known(sa.getSentenceRole(sa.concept)):
-               if(sa.getSentenceRole(sa.concept) == 'I'):
-                  self.updateCCSRStatus()
-               if sa.getSentencePhrase('ADJP') == self.ccsrmem.concepts[sa.getSentenceRole(sa.concept)].state:
-                  self.response("facial " + str(EXPR_NODYES)) # Nod Yes 
-                  self.response("say " + self.randomizedResponseVariation('yes'))
-               else:
-                  self.response("facial " + str(EXPR_SHAKENO)) # Shake no 
-                  self.response("say " + self.randomizedResponseVariation('no'))
-                  self.response("say " + sa.getSentencePhrase(sa.concept) + " " + conjugate('be', self.ccsrmem.concepts[sa.getSentenceRole(sa.concept)].person) + " " + self.ccsrmem.concepts[sa.getSentenceRole(sa.concept)].state)
-                  print self.ccsrmem.concepts['I'].state
+               result['types'] = [c[0] for c in classification]
+               try:
+                  for m in self.respondParsedStream(rebuildText(tagged, tags), classification):
+                     result['responses'].append(formatMessage(m))
+               except Exception, e:
+                  self.metrics.count('nlpParse.errors')
+                  result['error'] = '%s: %s' % (e.__class__.__name__, e)
+            yield result
+      finally:
+         self.sinks = sinks
+         self.stateDumpFile = stateDumpFile
+         self.skippedQueries = None
+         parser.close()
+
+   # Yield the response messages to a text parsed and classified by a batch worker
+   def respondParsedStream(self, text, classification):
+      for sentence, (st, concept, property) in zip(text, classification):
+         sa = sentenceAnalysisClass(sentence, self.debug)
+         sa.concept = concept
+         sa.property = property
+         self.metrics.count('sentences')
+         for m in self.respondSentence(sa, st):
+            yield m
+      yield ('listen', '')
+
+   # Yield the response messages to one analysed sentence of type st, and update memory accordingly
+   def respondSentence(self, sa, st):
+      start = self.metrics.start()
+      # Question state: 'how is X'
+      if st == 'questionState':
+         yield ccsrStatusRequest
+         self.updateCCSRStatus()
+         if sa.is2ndPersonalPronounPosessive('OBJ'):
+            # Question refers back to ccsr: how is 'your' X. Look up CCSR's personal property
+            for m in self.getPersonalProperty(sa):
+               yield m
+         elif self.ccsrmem.known(sa.getSentenceRole(sa.concept)):
+            # if we know anything about the concept, we rely on CCSR memory
+            if self.ccsrmem.concepts[sa.getSentenceRole(sa.concept)].state == 'none':
+               yield self.render('unknownState', phrase=sa.getSentencePhrase(sa.concept), person=self.ccsrmem.concepts[sa.getSentenceRole(sa.concept)].person)
+            else:   
+               yield self.render('state', phrase=sa.getSentencePhrase(sa.concept), person=self.ccsrmem.concepts[sa.getSentenceRole(sa.concept)].person, state=self.ccsrmem.concepts[sa.getSentenceRole(sa.concept)].state)
+         else:
+            if sa.complexQuery():
+               # Nothing is knows about the concept, and the query is 'complex', let's ask the cloud
+               yield self.render('lookUp')
+               # Looking up stuff makes CCSR happy and excited 
+               yield toMessage("mood 50 50")
+               for result in self.wolframAlphaAPI(sa):
+                  yield self.render('answer', text=result)              
             else:
-               self.response("say Sorry, I don't know " + sa.getSentencePhrase(sa.concept))
-         # Question definition: 'what/who is X'
-         elif st == 'questionDefinition':
-            if sa.is2ndPersonalPronounPosessive('OBJ'): 
-               # Question refers back to ccsr: what is 'your' X. Look up CCSR's personal property
+               yield self.render('unknown', phrase=sa.getSentencePhrase(sa.concept))
+      # Confirm state: 'is X Y'
+      elif st == 'confirmState':
+         if self.ccsrmem.known(sa.getSentenceRole(sa.concept)):
+            if(sa.getSentenceRole(sa.concept) == 'I'):
+               yield ccsrStatusRequest
                self.updateCCSRStatus()
-               self.getPersonalProperty(sa)
+            if sa.getSentencePhrase('ADJP') == self.ccsrmem.concepts[sa.getSentenceRole(sa.concept)].state:
+               yield toMessage("facial " + str(EXPR_NODYES)) # Nod Yes 
+               yield self.render('reply', reply=self.randomizedResponseVariation('yes'))
             else:
-               # Question about person, object or thing
-               if sa.complexQuery():
-                  self.response("say let me look that up for you")
-                  for result in self.wolframAlphaAPI(sa):
-                     self.response("say " + result)              
-               else:
-                  wordnetQuery = wordnet.synsets(sa.getSentenceRole(sa.concept))
-                  if len(wordnetQuery) > 0:
-                     self.response("say " + re.split(";",wordnetQuery[0].gloss)[0])
-                  else:
-                     # wordnet doesn't know, ask WolframAlpha
-                     self.response("say let me look that up for you")
-                     for result in self.wolframAlphaAPI(sa):
-                        self.response("say " + result)              
-         # State: 'X is Y'
-         elif st == 'statement':
-            if sa.is2ndPersonalPronounPosessive('SBJ'): 
-               # Refers back to ccsr: 'your' X is Y 
-               if sa.getSentenceRole(sa.concept) not in self.ccsrmem.concepts['I'].properties:
-                  self.ccsrmem.concepts['I'].properties[sa.getSentenceRole(sa.concept)] = [sa.getSentenceRole(sa.concept), sa.getSentencePhrase('OBJ')]
-               self.response("say " + self.randomizedResponseVariation('acknowledge')) 
+               yield toMessage("facial " + str(EXPR_SHAKENO)) # Shake no 
+               yield self.render('reply', reply=self.randomizedResponseVariation('no'))
+               yield self.render('state', phrase=sa.getSentencePhrase(sa.concept), person=self.ccsrmem.concepts[sa.getSentenceRole(sa.concept)].person, state=self.ccsrmem.concepts[sa.getSentenceRole(sa.concept)].state)
+               if self.debug:
+                  print self.ccsrmem.concepts['I'].state
+         else:
+            yield self.render('unknown', phrase=sa.getSentencePhrase(sa.concept))
+      # Question definition: 'what/who is X'
+      elif st == 'questionDefinition':
+         if sa.is2ndPersonalPronounPosessive('OBJ'): 
+            # Question refers back to ccsr: what is 'your' X. Look up CCSR's personal property
+            yield ccsrStatusRequest
+            self.updateCCSRStatus()
+            for m in self.getPersonalProperty(sa):
+               yield m
+         else:
+            # Question about person, object or thing
+            if sa.complexQuery():
+               yield self.render('lookUp')
+               for result in self.wolframAlphaAPI(sa):
+                  yield self.render('answer', text=result)              
             else:
-               if sa.getSentenceRole(sa.concept) == 'I':
-                  # Statement about CCSR, do not memorize this (CCSR maintains its own state based on CCSR telemetry
-                  # but instead react to statement
+               wordnetQuery = en.wordnet.synsets(sa.getSentenceRole(sa.concept))
+               if len(wordnetQuery) > 0:
+                  yield self.render('answer', text=re.split(";",wordnetQuery[0].gloss)[0])
+               else:
+                  # wordnet doesn't know, ask WolframAlpha
+                  yield self.render('lookUp')
+                  for result in self.wolframAlphaAPI(sa):
+                     yield self.render('answer', text=result)              
+      # State: 'X is Y'
+      elif st == 'statement':
+         if sa.is2ndPersonalPronounPosessive('SBJ'): 
+            # Refers back to ccsr: 'your' X is Y 
+            if sa.getSentenceRole(sa.concept) not in self.ccsrmem.concepts['I'].properties:
+               self.ccsrmem.concepts['I'].properties[sa.getSentenceRole(sa.concept)] = [sa.getSentenceRole(sa.concept), sa.getSentencePhrase('OBJ')]
+            yield self.render('reply', reply=self.randomizedResponseVariation('acknowledge')) 
+         else:
+            if sa.getSentenceRole(sa.concept) == 'I':
+               # Statement about CCSR, do not memorize this (CCSR maintains its own state based on CCSR telemetry
+               # but instead react to statement
+               if self.debug:
                   print 'ww ' + sa.getSentenceRole('ADJP')
-                  if sa.getSentenceRole('ADJP') in self.positivePhrases:
-                     # Saying something nice will maximize happiness and arousal
-                     self.response("set mood 500 500 ") 
-                     self.response("say " + self.randomizedResponseVariation('gratitude')) 
-                  else:
-                     # Saying something insulting will minimize happiness and increase arousal
-                     self.response("set mood -300 50 ") 
-                     self.response("say " + self.randomizedResponseVariation('insulted')) 
+               if sa.getSentenceRole('ADJP') in self.positivePhrases:
+                  # Saying something nice will maximize happiness and arousal
+                  yield toMessage("set mood 500 500 ") 
+                  yield self.render('reply', reply=self.randomizedResponseVariation('gratitude')) 
                else:
-                  if not self.ccsrmem.known(sa.getSentenceRole(sa.concept)):
-                     self.ccsrmem.add(sa.getSentenceRole(sa.concept))  
-                  self.ccsrmem.concepts[sa.getSentenceRole(sa.concept)].state = sa.getSentencePhrase('ADJP')
-                  self.response("say " + self.randomizedResponseVariation('acknowledge')) 
-         # State locality: 'X is in Y'
-         elif st == 'stateLocality':
-            if not self.ccsrmem.known(sa.getSentenceRole(sa.concept)):
-               self.ccsrmem.add(sa.getSentenceRole(sa.concept))  
-            self.ccsrmem.concepts[sa.getSentenceRole(sa.concept)].locality = sa.getSentencePhrase('PNP')
-            self.response("say " + self.randomizedResponseVariation('acknowledge')) 
-         # Question locality: 'Where is X'
-         elif st == 'questionLocality':
-            if self.ccsrmem.known(sa.getSentenceRole(sa.concept)):
-               if self.ccsrmem.concepts[sa.getSentenceRole(sa.concept)].locality == 'none':
-                  # Not knowing stuff makes CCSR sad and a little aroused 
-                  self.response("mood -50 20")
-                  self.response("say Sorry, I don't know where " + sa.getSentencePhrase(sa.concept) + ' ' + conjugate('be', self.ccsrmem.concepts[sa.getSentenceRole(sa.concept)].person))
-               else:   
-                  # Knowing stuff makes CCSR happy and a little aroused 
-                  self.response("mood 50 20")
-                  self.response("say " + sa.getSentencePhrase(sa.concept) + " " + conjugate('be', self.ccsrmem.concepts[sa.getSentenceRole(sa.concept)].person) + " " + self.ccsrmem.concepts[sa.getSentenceRole(sa.concept)].locality)
+                  # Saying something insulting will minimize happiness and increase arousal
+                  yield toMessage("set mood -300 50 ") 
+                  yield self.render('reply', reply=self.randomizedResponseVariation('insulted')) 
             else:
+               if not self.ccsrmem.known(sa.getSentenceRole(sa.concept)):
+                  self.ccsrmem.add(sa.getSentenceRole(sa.concept))  
+               self.ccsrmem.concepts[sa.getSentenceRole(sa.concept)].state = sa.getSentencePhrase('ADJP')
+               yield self.render('reply', reply=self.randomizedResponseVariation('acknowledge')) 
+      # State locality: 'X is in Y'
+      elif st == 'stateLocality':
+         if not self.ccsrmem.known(sa.getSentenceRole(sa.concept)):
+            self.ccsrmem.add(sa.getSentenceRole(sa.concept))  
+         self.ccsrmem.concepts[sa.getSentenceRole(sa.concept)].locality = sa.getSentencePhrase('PNP')
+         yield self.render('reply', reply=self.randomizedResponseVariation('acknowledge')) 
+      # Question locality: 'Where is X'
+      elif st == 'questionLocality':
+         if self.ccsrmem.known(sa.getSentenceRole(sa.concept)):
+            if self.ccsrmem.concepts[sa.getSentenceRole(sa.concept)].locality == 'none':
                # Not knowing stuff makes CCSR sad and a little aroused 
-               self.response("mood -50 20")
-               self.response("say Sorry, I don't know " + sa.getSentencePhrase(sa.concept))
-         # Command
-         elif st == 'command':
-            if self.cap.capable(sa.getSentenceHead('VP')):
-               # Command is a prefixed CCSR command to be given through telemetry
-               self.response("facial " + str(EXPR_NODYES)) # Nod Yes 
-               self.response("say " + self.randomizedResponseVariation('yes') + " I can") 
-               for cmd in self.cap.constructCmd(sa):
-                  self.response(cmd)
-            elif sa.getSentenceHead('VP') == 'tell':
-               # This is a request to tell something about a topic
-               if len(sa.s.pnp) > 0:
-                  # We have a prepositional phrase: 'tell me about X'
-                  concept = sa.reflectObject(sa.s.pnp[0].head.string)
-                  if self.ccsrmem.known(concept):
-                     if  len(self.ccsrmem.concepts[concept].properties) > 0:
-                        for p in self.ccsrmem.concepts[concept].properties:
-                           self.response("say " + self.ccsrmem.posessivePronouns[self.ccsrmem.concepts[concept].person] + " " + self.ccsrmem.concepts[concept].properties[p][0] + " is " + self.ccsrmem.concepts[concept].properties[p][1])            
-                     else:
-                        self.response("say sorry, I can't tell you much about " + sa.reflectObject(sa.s.pnp[0].head.string))
+               yield toMessage("mood -50 20")
+               yield self.render('unknownLocality', phrase=sa.getSentencePhrase(sa.concept), person=self.ccsrmem.concepts[sa.getSentenceRole(sa.concept)].person)
+            else:   
+               # Knowing stuff makes CCSR happy and a little aroused 
+               yield toMessage("mood 50 20")
+               yield self.render('locality', phrase=sa.getSentencePhrase(sa.concept), person=self.ccsrmem.concepts[sa.getSentenceRole(sa.concept)].person, locality=self.ccsrmem.concepts[sa.getSentenceRole(sa.concept)].locality)
+         else:
+            # Not knowing stuff makes CCSR sad and a little aroused 
+            yield toMessage("mood -50 20")
+            yield self.render('unknown', phrase=sa.getSentencePhrase(sa.concept))
+      # Command
+      elif st == 'command':
+         if self.cap.capable(sa.getSentenceHead('VP')):
+            # Command is a prefixed CCSR command to be given through telemetry
+            yield toMessage("facial " + str(EXPR_NODYES)) # Nod Yes 
+            yield self.render('canDo', reply=self.randomizedResponseVariation('yes')) 
+            for cmd in self.cap.constructCmd(sa):
+               yield toMessage(cmd)
+         elif sa.getSentenceHead('VP') == 'tell':
+            # This is a request to tell something about a topic
+            if len(sa.s.pnp) > 0:
+               # We have a prepositional phrase: 'tell me about X'
+               concept = sa.reflectObject(sa.s.pnp[0].head.string)
+               if self.ccsrmem.known(concept):
+                  if  len(self.ccsrmem.concepts[concept].properties) > 0:
+                     for p in self.ccsrmem.concepts[concept].properties:
+                        yield self.render('property', owner=self.ccsrmem.posessivePronouns[self.ccsrmem.concepts[concept].person], name=self.ccsrmem.concepts[concept].properties[p][0], value=self.ccsrmem.concepts[concept].properties[p][1])
                   else:
-                     self.response("say let me look that up for you")
-                     self.response("say " + self.wolframAlphaAPI(sa))              
-            else:
-               # Not knowing stuff makes CCSR sad and a little aroused 
-               self.response("mood -50 20")
-               self.response("facial " + str(EXPR_SHAKENO)) 
-               self.response("say " + self.randomizedResponseVariation('no')) 
-               self.response("say I'm afraid I can't do that. I don't know how to " + sa.getSentenceHead('VP'))
-         # State locality: 'X is in Y'
-         elif st == 'greeting':
-            self.response("say " + self.randomizedResponseVariation('hi')) 
-         elif st == 'bye':
-            self.response("say " + self.randomizedResponseVariation('bye'))
-            # Turn away and start autonomously exploring
-            self.response("turn 1 100000")
-            self.response("set state 7")
-         elif st == 'gratitude':
-            self.response("say " + self.randomizedResponseVariation('gratitudeReply')) 
-         elif st == 'adverbPhrase':
-            if sa.getSentenceHead('ADJP') == 'further':
-               for cmd in self.cap.lastCmd:
-                  self.response(cmd)
+                     yield self.render('cantTell', phrase=sa.reflectObject(sa.s.pnp[0].head.string))
+               else:
+                  yield self.render('lookUp')
+                  for result in self.wolframAlphaAPI(sa):
+                     yield self.render('answer', text=result)
          else:
-            self.response("say sorry, I don't understand")
-         self.cap.lastCmd = self.cap.constructCmd(sa)
-      self.response("listen")
+            # Not knowing stuff makes CCSR sad and a little aroused 
+            yield toMessage("mood -50 20")
+            yield toMessage("facial " + str(EXPR_SHAKENO)) 
+            yield self.render('reply', reply=self.randomizedResponseVariation('no')) 
+            yield self.render('cantDo', verb=sa.getSentenceHead('VP'))
+      # State locality: 'X is in Y'
+      elif st == 'greeting':
+         yield self.render('reply', reply=self.randomizedResponseVariation('hi')) 
+      elif st == 'bye':
+         yield self.render('reply', reply=self.randomizedResponseVariation('bye'))
+         # Turn away and start autonomously exploring
+         yield toMessage("turn 1 100000")
+         yield toMessage("set state 7")
+      elif st == 'gratitude':
+         yield self.render('reply', reply=self.randomizedResponseVariation('gratitudeReply')) 
+      elif st == 'adverbPhrase':
+         if sa.getSentenceHead('ADJP') == 'further':
+            for cmd in self.cap.lastCmd:
+               yield toMessage(cmd)
+      else:
+         self.metrics.count('sentences.unknown')
+         yield self.render('notUnderstood')
+      self.cap.lastCmd = self.cap.constructCmd(sa)
+      self.metrics.stop('sentence.' + str(st), start)